@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Time changelog against a local fake GitHub serving synthetic repos, reporting
+wall time, requests, bytes transferred and peak memory for each stage.
+
+    python benchmarks/run.py --sizes 10 1000 --latency 0.02 --graphql
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from changelog import (  # noqa: E402
+    TRANSPORTS,
+    Authorization,
+    GitHubConfig,
+    GithubAPI,
+    SessionConfig,
+    fetch_changes,
+    format_changes,
+    generate_changelog,
+)
+from changelog.tests.fake_github import (  # noqa: E402
+    FakeGitHub,
+    FakeGitHubConfig,
+    SyntheticRepo,
+)
+
+DEFAULT_SIZES = [10, 1000, 100_000]
+BASE_URL = "https://github.com"
+
+
+@dataclass
+class Result:
+    benchmark: str
+    size: int
+    # Best of the repeats
+    seconds: float
+    requests: int
+    bytes_transferred: int
+    peak_memory: int
+
+
+class FakeGitHubProcess:
+    """ Runs a :class:`FakeGitHub` in its own process, so that serving
+    requests doesn't count towards the time and memory being measured """
+
+    def __init__(self, repo: SyntheticRepo, config: FakeGitHubConfig):
+        parent, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(repo, config, child), daemon=True
+        )
+        self._process.start()
+        self.url = parent.recv()
+
+    def stats(self) -> Dict[str, Any]:
+        with urlopen(f"{self.url}/_stats") as response:
+            return json.load(response)
+
+    def reset(self) -> None:
+        urlopen(Request(f"{self.url}/_reset", data=b"", method="POST")).close()
+
+    def stop(self) -> None:
+        self._process.terminate()
+        self._process.join()
+
+
+def _serve(repo: SyntheticRepo, config: FakeGitHubConfig, conn) -> None:
+    server = FakeGitHub(repo, config)
+    conn.send(server.url)
+    server.serve_forever()
+
+
+def measure(
+    name: str,
+    size: int,
+    fake: FakeGitHubProcess,
+    run: Callable[[], Any],
+    repeat: int,
+) -> Result:
+    """ Time the best of ``repeat`` runs, then make one more under
+    tracemalloc for the peak memory, which would otherwise skew the times """
+    times = []
+    for _ in range(repeat):
+        fake.reset()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    stats = fake.stats()
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Result(
+        benchmark=name,
+        size=size,
+        seconds=min(times),
+        requests=stats["requests"],
+        bytes_transferred=stats["bytes_received"] + stats["bytes_sent"],
+        peak_memory=peak,
+    )
+
+
+def run_size(size: int, args: argparse.Namespace) -> List[Result]:
+    repo = SyntheticRepo(size)
+    config = FakeGitHubConfig(
+        latency=args.latency,
+        search_page_size=args.page_size,
+        rate_limit=args.rate_limit,
+        rate_limit_window=args.rate_limit_window,
+    )
+    fake = FakeGitHubProcess(repo, config)
+    github_config = GitHubConfig(
+        api_url=fake.url,
+        authorization=Authorization(None),
+        session_config=SessionConfig(transport=args.transport),
+    )
+    options = dict(previous_tag_name="v0", current_tag_name="v1")
+    options.update(use_graphql=args.graphql, ancestry=args.ancestry)
+
+    def fetch():
+        with GithubAPI(github_config, repo.owner, repo.name) as github_api:
+            return fetch_changes(github_api, **options)
+
+    prs = fetch()
+
+    def format():
+        return format_changes(BASE_URL, repo.owner, repo.name, prs)
+
+    def generate():
+        return generate_changelog(
+            repo.owner,
+            repo.name,
+            previous_tag="v0",
+            current_tag="v1",
+            github_base_url=BASE_URL,
+            github_api_url=fake.url,
+            graphql=args.graphql,
+            ancestry=args.ancestry,
+            transport=args.transport,
+        )
+
+    try:
+        return [
+            measure("fetch_changes", size, fake, fetch, args.repeat),
+            measure("format_changes", size, fake, format, args.repeat),
+            measure("generate_changelog", size, fake, generate, args.repeat),
+        ]
+    finally:
+        fake.stop()
+
+
+def print_results(
+    results: List[Result], baseline: Optional[Dict[Any, Dict[str, Any]]] = None
+) -> None:
+    header = f"{'benchmark':<20} {'PRs':>7} {'seconds':>9} {'requests':>8} "
+    header += f"{'KiB':>9} {'peak KiB':>9}"
+    if baseline:
+        header += f" {'vs baseline':>11}"
+    print(header)
+    for result in results:
+        line = f"{result.benchmark:<20} {result.size:>7} {result.seconds:>9.3f} "
+        line += f"{result.requests:>8} {result.bytes_transferred / 1024:>9.1f} "
+        line += f"{result.peak_memory / 1024:>9.1f}"
+        previous = (baseline or {}).get((result.benchmark, result.size))
+        if previous:
+            line += f" {result.seconds / previous['seconds']:>10.2f}x"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark changelog against a local fake GitHub"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="how many PRs the synthetic repos have",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to every response"
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=100,
+        help="the largest page of search results the fake GitHub serves",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=1_000_000,
+        help="requests allowed per window for each of REST and GraphQL",
+    )
+    parser.add_argument(
+        "--rate-limit-window",
+        type=float,
+        default=3600.0,
+        help="seconds until the rate limit resets",
+    )
+    parser.add_argument("--graphql", action="store_true")
+    parser.add_argument("--ancestry", action="store_true")
+    parser.add_argument(
+        "--transport",
+        choices=TRANSPORTS,
+        default="requests",
+        help="what changelog makes its requests with",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="how many times to time each benchmark"
+    )
+    parser.add_argument("--output", type=str, help="write the results to a JSON file")
+    parser.add_argument(
+        "--baseline", type=str, help="compare the times to an earlier --output file"
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {(r["benchmark"], r["size"]): r for r in json.load(f)["results"]}
+
+    results = []
+    for size in args.sizes:
+        results.extend(run_size(size, args))
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"options": vars(args), "results": [asdict(r) for r in results]},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Check that importing changelog and running ``changelog --help`` stay within
+a startup budget, using ``python -X importtime``. Exits non-zero when over,
+or when either loads a module that should only be imported once needed.
+
+    python benchmarks/startup.py --budget-ms 75
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds importing the package may take, cumulative of what it imports
+DEFAULT_BUDGET_MS = 75.0
+DEFAULT_RUNS = 10
+
+# Modules only needed once a request is made or the command line is parsed
+DEFERRED_MODULES = ("requests", "urllib3", "concurrent.futures", "argparse")
+# Modules --help doesn't need
+HELP_DEFERRED_MODULES = ("requests", "urllib3")
+
+HELP = "import sys; sys.argv = ['changelog', '--help']; import changelog; changelog.main()"
+
+
+def import_times(code: str) -> Tuple[Dict[str, int], str]:
+    """ Run code under ``-X importtime``, returning the cumulative
+    microseconds each module took to import and the code's output """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times, result.stdout
+
+
+def wall_time(code: str) -> float:
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", code], env=env, stdout=subprocess.DEVNULL, check=True
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enforce changelog's startup budget")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=DEFAULT_BUDGET_MS,
+        help="milliseconds importing changelog may take, best of the runs",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=DEFAULT_RUNS, help="how many times to measure"
+    )
+    parser.add_argument(
+        "--warn-over-budget",
+        action="store_true",
+        help="only report going over the budget, timings vary too much between machines",
+    )
+    args = parser.parse_args()
+
+    failures: List[str] = []
+    import_ms = []
+    for _ in range(args.runs):
+        times, _ = import_times("import changelog")
+        import_ms.append(times["changelog"] / 1000)
+    for module in DEFERRED_MODULES:
+        if module in times:
+            failures.append(f"import changelog imports {module}")
+
+    help_times, _ = import_times(HELP)
+    for module in HELP_DEFERRED_MODULES:
+        if module in help_times:
+            failures.append(f"changelog --help imports {module}")
+
+    help_ms = min(wall_time(HELP) for _ in range(args.runs)) * 1000
+    baseline_ms = min(wall_time("pass") for _ in range(args.runs)) * 1000
+    best = min(import_ms)
+    print(f"import changelog: {best:.1f}ms (budget {args.budget_ms:.1f}ms)")
+    print(f"changelog --help: {help_ms:.1f}ms, of which {baseline_ms:.1f}ms is Python")
+    if best > args.budget_ms:
+        if args.warn_over_budget:
+            print(f"WARNING: import changelog took {best:.1f}ms", file=sys.stderr)
+        else:
+            failures.append(f"import changelog took {best:.1f}ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
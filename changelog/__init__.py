@@ -3,18 +3,195 @@
 This is a script to determine which PRs have been merges since the last
 release, or between two releases on the same branch.
 """
-import argparse
+import math
 import os
-from dataclasses import dataclass
-from datetime import datetime
+import random
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from bisect import bisect_left
+from functools import lru_cache
+from datetime import datetime, timedelta
 from operator import attrgetter
-from typing import Any, Dict, List, Optional
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+)
 
-import requests
+from changelog.cache import CachedResponse, ResponseCache
+from changelog.ratelimit import CORE, GRAPHQL, RateLimiter, is_rate_limited
+from changelog.render import (
+    RENDERERS,
+    RstRenderer,
+    Section,
+    iter_rendered,
+    write_rendered,
+)
+from changelog.tracing import (
+    RequestHook,
+    RequestSpan,
+    TraceRecorder,
+    rate_limit_headers,
+    rest_endpoint,
+)
+
+# requests and concurrent.futures are only imported once requests are made,
+# and argparse once the command line is parsed, so that importing the package
+# and runs answered from the caches start quickly
+if TYPE_CHECKING:
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+
+    import requests
+
+    from changelog.store import MetadataStore
 
 PUBLIC_GITHUB_URL = "https://github.com"
 PUBLIC_GITHUB_API_URL = "https://api.github.com"
 
+# The largest page the GraphQL search connection will return
+SEARCH_PAGE_SIZE = 100
+# GitHub search never returns more than this many results for one query
+SEARCH_RESULT_LIMIT = 1000
+# Windows are sized to be this full on average, leaving headroom for bursts
+SEARCH_WINDOW_FILL = 0.75
+# How many requests a single call fans out to at once
+MAX_WORKERS = 4
+# The largest page of commits the compare endpoint will return
+COMPARE_PAGE_SIZE = 100
+
+# What requests are made with: the requests package, or the standard
+# library's http.client through changelog.transport
+TRANSPORTS = ("requests", "http.client")
+
+# Guards creating a GithubAPI's session on its first request
+_session_lock = threading.Lock()
+
+# How many PRs are looked up by number in one GraphQL query
+PULL_REQUEST_BATCH_SIZE = 100
+# How many of each PR's labels are fetched along with it
+LABELS_PER_PULL_REQUEST = 20
+
+PULL_REQUEST_FIELDS_FRAGMENT = """
+fragment PullRequestFields on PullRequest {
+  title
+  number
+  author { login }
+  mergedAt
+  mergeCommit { oid }
+  baseRefName
+  labels(first: %d) { nodes { name } }
+}
+""" % LABELS_PER_PULL_REQUEST
+
+PR_SEARCH_QUERY = PULL_REQUEST_FIELDS_FRAGMENT + """
+query($query: String!, $first: Int!, $after: String) {
+  rateLimit { cost remaining }
+  search(query: $query, type: ISSUE, first: $first, after: $after) {
+    issueCount
+    pageInfo { endCursor hasNextPage }
+    nodes {
+      ... on PullRequest { ...PullRequestFields }
+    }
+  }
+}
+"""
+
+# The aliased commit lookups are filled in for each batch. Only PRs whose
+# merge commit is in the range were merged in it, the rest merely contain
+# one of its commits.
+ASSOCIATED_PULL_REQUESTS_QUERY = PULL_REQUEST_FIELDS_FRAGMENT + """
+query($owner: String!, $repo: String!) {
+  rateLimit { cost remaining }
+  repository(owner: $owner, name: $repo) {
+    %s
+  }
+}
+
+fragment AssociatedPullRequests on Commit {
+  associatedPullRequests(first: 5) {
+    nodes { ...PullRequestFields }
+  }
+}
+"""
+
+# The aliased pullRequest lookups are filled in for each batch
+PULL_REQUESTS_QUERY = PULL_REQUEST_FIELDS_FRAGMENT + """
+query($owner: String!, $repo: String!) {
+  rateLimit { cost remaining }
+  repository(owner: $owner, name: $repo) {
+    %s
+  }
+}
+"""
+
+COMMIT_FIELDS_FRAGMENT = """
+fragment CommitFields on Commit {
+  oid
+  authoredDate
+  message
+  author { name user { login } }
+}
+"""
+
+# Annotated tags are followed to their commit
+REF_TARGET_FRAGMENT = COMMIT_FIELDS_FRAGMENT + """
+fragment RefTarget on Ref {
+  name
+  target {
+    ... on Commit { ...CommitFields }
+    ... on Tag { target { ... on Commit { ...CommitFields } } }
+  }
+}
+"""
+
+# Resolves both ends of a range in one request. The latest tag is looked up
+# when no previous tag is named.
+RANGE_QUERY = REF_TARGET_FRAGMENT + """
+query(
+  $owner: String!,
+  $repo: String!,
+  $previous: String!,
+  $current: String!,
+  $latest: Boolean!
+) {
+  rateLimit { cost remaining }
+  repository(owner: $owner, name: $repo) {
+    latest: refs(
+      refPrefix: "refs/tags/",
+      first: 1,
+      orderBy: {field: TAG_COMMIT_DATE, direction: DESC}
+    ) @include(if: $latest) {
+      nodes { ...RefTarget }
+    }
+    previous: ref(qualifiedName: $previous) @skip(if: $latest) { ...RefTarget }
+    current: ref(qualifiedName: $current) { ...RefTarget }
+  }
+}
+"""
+
+TAGS_QUERY = REF_TARGET_FRAGMENT + """
+query($owner: String!, $repo: String!, $first: Int!, $after: String) {
+  rateLimit { cost remaining }
+  repository(owner: $owner, name: $repo) {
+    refs(refPrefix: "refs/tags/", first: $first, after: $after) {
+      pageInfo { endCursor hasNextPage }
+      nodes { ...RefTarget }
+    }
+  }
+}
+"""
+
 
 @dataclass(frozen=True)
 class Authorization:
@@ -29,10 +206,42 @@ class Authorization:
         return {"Authorization": f"Bearer {self.token}"}
 
 
+@dataclass(frozen=True)
+class SessionConfig:
+    pool_connections: int = 10
+    pool_maxsize: int = 10
+    keep_alive: bool = True
+    # One of TRANSPORTS
+    transport: str = "requests"
+
+
+@dataclass(frozen=True)
+class TimeoutConfig:
+    connect: float = 5.0
+    read: float = 30.0
+
+
+@dataclass(frozen=True)
+class RetryConfig:
+    total: int = 3
+    backoff_factor: float = 0.5
+    max_backoff: float = 30.0
+    status_forcelist: Tuple[int, ...] = (500, 502, 503, 504)
+
+    def backoff(self, attempt: int) -> float:
+        """ How long to wait before the given retry, with full jitter so that
+        concurrent clients don't retry in lockstep """
+        ceiling = min(self.max_backoff, self.backoff_factor * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+
 @dataclass(frozen=True)
 class GitHubConfig:
     api_url: str
     authorization: Authorization
+    session_config: SessionConfig = SessionConfig()
+    timeout_config: TimeoutConfig = TimeoutConfig()
+    retry_config: RetryConfig = RetryConfig()
 
 
 @dataclass(frozen=True)
@@ -44,12 +253,25 @@ class Commit:
 
     @classmethod
     def init_from_api(cls, commit_json: Dict[str, Any]) -> "Commit":
-        datetime_str = commit_json["commit"]["author"]["date"]
+        git_author = commit_json["commit"]["author"]
+        # Commits by emails that aren't linked to an account have no author
+        author = commit_json.get("author") or {"login": git_author["name"]}
         return Commit(
             sha=commit_json["sha"],
-            datetime=parse_datetime_string(datetime_str),
+            datetime=parse_datetime_string(git_author["date"]),
             message=commit_json["commit"]["message"],
-            author=commit_json["author"]["login"],
+            author=author["login"],
+        )
+
+    @classmethod
+    def init_from_graphql(cls, commit_json: Dict[str, Any]) -> "Commit":
+        # Commits by emails that aren't linked to an account have no user
+        author = commit_json["author"]
+        return Commit(
+            sha=commit_json["oid"],
+            datetime=parse_datetime_string(commit_json["authoredDate"]),
+            message=commit_json["message"],
+            author=(author["user"] or {}).get("login", author["name"]),
         )
 
 
@@ -64,6 +286,34 @@ class PullRequest:
     number: int
     title: str
     author: str
+    merged_at: Optional[datetime] = None
+    merge_commit_sha: Optional[str] = None
+    base_ref_name: Optional[str] = None
+    labels: Tuple[str, ...] = ()
+
+    @classmethod
+    def init_from_api(cls, pr_json: Dict[str, Any]) -> "PullRequest":
+        # Deleted accounts come back as a null author
+        author = pr_json.get("author") or {"login": "ghost"}
+        merged_at = pr_json.get("mergedAt")
+        merge_commit = pr_json.get("mergeCommit") or {}
+        labels = (pr_json.get("labels") or {}).get("nodes", [])
+        return PullRequest(
+            number=pr_json["number"],
+            title=pr_json["title"],
+            author=author["login"],
+            merged_at=parse_datetime_string(merged_at) if merged_at else None,
+            merge_commit_sha=merge_commit.get("oid"),
+            base_ref_name=pr_json.get("baseRefName"),
+            labels=tuple(label["name"] for label in labels),
+        )
+
+
+@dataclass(frozen=True)
+class Release:
+    previous_tag: Tag
+    tag: Tag
+    prs: Tuple[PullRequest, ...]
 
 
 @dataclass(frozen=True)
@@ -71,6 +321,44 @@ class GithubAPI:
     config: GitHubConfig
     owner: str
     repo: str
+    # Created on the first request if not given. Any transport with the same
+    # request() and close() methods can be used, see changelog.transport.
+    session: Optional["requests.Session"] = field(
+        default=None, repr=False, compare=False
+    )
+    cache: Optional[ResponseCache] = field(default=None, repr=False, compare=False)
+    rate_limiter: Optional[RateLimiter] = field(
+        default=None, repr=False, compare=False
+    )
+    # time.monotonic() value after which no more requests are made
+    deadline: Optional[float] = field(default=None, compare=False)
+    store: Optional["MetadataStore"] = field(default=None, repr=False, compare=False)
+    # Called with a RequestSpan for every request, see changelog.tracing
+    request_hooks: Tuple[RequestHook, ...] = field(
+        default=(), repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        if self.rate_limiter is None:
+            object.__setattr__(self, "rate_limiter", RateLimiter())
+
+    def __enter__(self) -> "GithubAPI":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """ Release the pooled connections held by the session """
+        if self.session is not None:
+            self.session.close()
+
+    def _session(self) -> "requests.Session":
+        if self.session is None:
+            with _session_lock:
+                if self.session is None:
+                    object.__setattr__(self, "session", create_session(self.config))
+        return self.session
 
     @property
     def repo_url(self) -> str:
@@ -93,43 +381,283 @@ class GithubAPI:
     def compare_commits_url(self, first_commit: Commit, last_commit: Commit) -> str:
         return f"{self.repo_url}/compare/{first_commit.sha}...{last_commit.sha}"
 
-    def graphql_query(self, query: str) -> Dict[str, Any]:
-        request = requests.post(
+    def _request(
+        self,
+        method: str,
+        url: str,
+        resource: str,
+        idempotent: bool = True,
+        endpoint: Optional[str] = None,
+        cached: Optional[bool] = None,
+        **kwargs,
+    ) -> Tuple["requests.Response", Any]:
+        """ Make a request once the rate limiter allows it, returning the
+        response and, if it was a 200, its parsed body. Idempotent requests
+        that time out, fail to connect or get a 5xx are retried with jittered
+        exponential backoff, as is anything refused by a rate limit.
+
+        Each attempt is reported to the request hooks under ``endpoint``,
+        along with whether a ``cached`` response was being revalidated. """
+        retry_config = self.config.retry_config
+        # Sent on every request, as the session may not have been made by
+        # create_session
+        headers = github_headers(self.config)
+        headers.update(kwargs.get("headers") or {})
+        kwargs["headers"] = headers
+        attempt = 0
+        while True:
+            self._wait_for_rate_limit(resource)
+            started = time.time()
+            start = time.monotonic()
+            try:
+                response = self._session().request(
+                    method, url, timeout=self._timeout(), **kwargs
+                )
+            except self._retryable_exceptions() as e:
+                self._trace(
+                    method,
+                    url,
+                    endpoint,
+                    started,
+                    time.monotonic() - start,
+                    attempt,
+                    cache=None if cached is None else "miss",
+                    error=str(e),
+                )
+                if not idempotent or attempt >= retry_config.total:
+                    raise GitHubError(f"Query failed to run: {e}\n\n{url}") from e
+            else:
+                # Parsed once here so that the request hooks can be told what
+                # a GraphQL query cost
+                body = response.json() if response.status_code == 200 else None
+                cache = None
+                if cached is not None:
+                    revalidated = cached and response.status_code == 304
+                    cache = "hit" if revalidated else "miss"
+                self._trace(
+                    method,
+                    url,
+                    endpoint,
+                    started,
+                    time.monotonic() - start,
+                    attempt,
+                    response=response,
+                    cache=cache,
+                    graphql_cost=_graphql_cost(body) if resource == GRAPHQL else None,
+                )
+                self.rate_limiter.update(
+                    resource, response.headers, response.status_code, response.content
+                )
+                rate_limited = is_rate_limited(
+                    response.headers, response.status_code, response.content
+                )
+                retryable = rate_limited or (
+                    idempotent and response.status_code in retry_config.status_forcelist
+                )
+                if not retryable:
+                    return response, body
+                if attempt >= retry_config.total:
+                    if rate_limited:
+                        raise RateLimitError(
+                            f"Query was refused by the {resource} rate limit "
+                            f"{attempt + 1} times\n\n{url}",
+                            resource=resource,
+                        )
+                    return response, body
+
+            attempt += 1
+            self._sleep(retry_config.backoff(attempt))
+
+    def _retryable_exceptions(self) -> Tuple[type, ...]:
+        # Transports other than requests say what they raise
+        exceptions = getattr(self.session, "retryable_exceptions", None)
+        return exceptions or retryable_exceptions()
+
+    def _trace(
+        self,
+        method: str,
+        url: str,
+        endpoint: Optional[str],
+        started: float,
+        duration: float,
+        attempt: int,
+        response: Optional["requests.Response"] = None,
+        cache: Optional[str] = None,
+        error: Optional[str] = None,
+        graphql_cost: Optional[int] = None,
+    ) -> None:
+        """ Report a request to the request hooks """
+        if not self.request_hooks:
+            return
+        if endpoint is None:
+            path = url.split("?", 1)[0]
+            if path.startswith(self.repo_url + "/"):
+                endpoint = rest_endpoint(path[len(self.repo_url) + 1:])
+            else:
+                endpoint = path[len(self.config.api_url):] or path
+        has_response = response is not None
+        span = RequestSpan(
+            method=method,
+            # The response's URL includes the query string
+            url=response.url if has_response else url,
+            endpoint=endpoint,
+            started=started,
+            duration=duration,
+            status=response.status_code if has_response else None,
+            size=len(response.content) if has_response else 0,
+            cache=cache,
+            attempt=attempt,
+            rate_limit=rate_limit_headers(response.headers) if has_response else {},
+            error=error,
+            graphql_cost=graphql_cost,
+        )
+        for hook in self.request_hooks:
+            hook(span)
+
+    def _timeout(self) -> Tuple[float, float]:
+        timeout_config = self.config.timeout_config
+        read_timeout = timeout_config.read
+        if self.deadline is not None:
+            read_timeout = min(read_timeout, self._time_left())
+        return timeout_config.connect, read_timeout
+
+    def _time_left(self) -> float:
+        time_left = self.deadline - time.monotonic()
+        if time_left <= 0:
+            raise DeadlineExceeded("Ran out of time talking to GitHub")
+        return time_left
+
+    def _sleep(self, seconds: float) -> None:
+        if self.deadline is not None and seconds >= self._time_left():
+            raise DeadlineExceeded(
+                f"Waiting {seconds:.1f}s to retry would pass the deadline"
+            )
+        time.sleep(seconds)
+
+    def _wait_for_rate_limit(self, resource: str) -> None:
+        delay = self.rate_limiter.delay(resource)
+        max_wait = self.rate_limiter.max_wait
+        if max_wait is not None and delay > max_wait:
+            raise RateLimitError(
+                f"The {resource} rate limit is exhausted for another {delay:.0f}s",
+                resource=resource,
+            )
+        if delay > 0:
+            self._sleep(delay)
+
+    def graphql_query(
+        self,
+        query: str,
+        variables: Optional[Dict[str, Any]] = None,
+        name: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """ Run a query, ``name`` tells the request hooks what it is for """
+        payload: Dict[str, Any] = {"query": query}
+        if variables is not None:
+            payload["variables"] = variables
+        request, result = self._request(
+            "POST",
             f"{self.config.api_url}/graphql",
-            json={"query": query},
+            GRAPHQL,
+            endpoint=f"graphql/{name}" if name else "graphql",
+            json=payload,
             headers=self.config.authorization.bearer_auth,
         )
-        if request.status_code == 200:
-            return request.json()
-        else:
+        if request.status_code != 200:
             raise GitHubError(
                 f"Query failed to run by returning code of {request.status_code}\n\n{query}"
             )
 
-    def api_query(self, url: str, params: Optional[Dict[str, str]] = None) -> Any:
-        request = requests.get(
-            url, params=params, headers=self.config.authorization.token_auth
+        if result.get("errors") and not result.get("data"):
+            messages = "\n".join(e.get("message", "") for e in result["errors"])
+            raise GitHubError(f"Query returned errors\n\n{messages}\n\n{query}")
+
+        rate_limit = (result.get("data") or {}).get("rateLimit")
+        if rate_limit:
+            self.rate_limiter.record_cost(
+                GRAPHQL, rate_limit["cost"], rate_limit["remaining"]
+            )
+        return result
+
+    def api_query(
+        self,
+        url: str,
+        params: Optional[Dict[str, str]] = None,
+        immutable: bool = False,
+    ) -> Any:
+        """ GET a REST endpoint, going through the response cache if there is
+        one. Immutable responses (objects addressed by sha) are served from
+        the cache without a request, anything else is revalidated. """
+        cached = self.cache.get(url, params) if self.cache is not None else None
+        if cached is not None and immutable:
+            self._trace("GET", url, None, time.time(), 0.0, 0, cache="hit")
+            return cached.body
+
+        headers = cached.validators if cached is not None else None
+        request, body = self._request(
+            "GET",
+            url,
+            CORE,
+            cached=None if self.cache is None else cached is not None,
+            params=params,
+            headers=headers,
         )
-        if request.status_code == 200:
-            return request.json()
-        else:
+        # 304s are not counted against the rate limit
+        if request.status_code == 304 and cached is not None:
+            return cached.body
+        if request.status_code != 200:
             raise GitHubError(
                 f"Query failed to run by returning code of {request.status_code}\n\n{url}"
             )
 
+        if self.cache is not None:
+            self.cache.set(
+                url,
+                params,
+                CachedResponse(
+                    body=body,
+                    etag=request.headers.get("ETag"),
+                    last_modified=request.headers.get("Last-Modified"),
+                ),
+            )
+        return body
+
     def get_tag(self, name: str) -> Tag:
         """ Get the commit sha for a given git tag """
+        if self.store is not None:
+            tag = self.store.get_tag(self.owner, self.repo, name)
+            if tag is not None:
+                return tag
+
         tag_url = self.tag_ref_url(name)
         tag_json = {}
+        # Tag refs can be moved, but the tag objects they point at can't
+        immutable = False
         while "object" not in tag_json or tag_json["object"]["type"] != "commit":
-            tag_json = self.api_query(tag_url)
+            tag_json = self.api_query(tag_url, immutable=immutable)
 
             # If we're given a tag object we have to look up the commit
             if tag_json["object"]["type"] == "tag":
                 tag_url = tag_json["object"]["url"]
+                immutable = True
+
+        tag = Tag(name, self.get_commit(tag_json["object"]["sha"]))
+        if self.store is not None:
+            self.store.put_tag(self.owner, self.repo, tag)
+        return tag
 
-        commit_json = self.api_query(self.get_commit_url(tag_json["object"]["sha"]))
-        return Tag(name, Commit.init_from_api(commit_json))
+    def get_commit(self, sha: str) -> Commit:
+        """ Get a commit by its sha """
+        if self.store is not None:
+            commit = self.store.get_commit(self.owner, self.repo, sha)
+            if commit is not None:
+                return commit
+
+        commit_json = self.api_query(self.get_commit_url(sha), immutable=True)
+        commit = Commit.init_from_api(commit_json)
+        if self.store is not None:
+            self.store.put_commits(self.owner, self.repo, [commit])
+        return commit
 
     def get_last_commit(self, branch: str = "master") -> Commit:
         """ Get the last commit sha for the given repo and branch """
@@ -145,95 +673,684 @@ class GithubAPI:
         # 0 contains the latest tag
         return self.get_tag(tags_json[0]["name"])
 
+    def resolve_range(
+        self,
+        previous_tag_name: Optional[str] = None,
+        current_tag_name: Optional[str] = None,
+        branch: str = "master",
+    ) -> Tuple[Tag, Commit]:
+        """ Get the previous tag and the current tag's commit (or the branch
+        head) in a single GraphQL query. Without a previous tag name the tag
+        on the most recent commit is used. """
+        if self.store is not None and None not in (previous_tag_name, current_tag_name):
+            previous_tag = self.store.get_tag(self.owner, self.repo, previous_tag_name)
+            current_tag = self.store.get_tag(self.owner, self.repo, current_tag_name)
+            if previous_tag is not None and current_tag is not None:
+                return previous_tag, current_tag.commit
+
+        if current_tag_name is not None:
+            current_ref = f"refs/tags/{current_tag_name}"
+        else:
+            current_ref = f"refs/heads/{branch}"
+        variables = {
+            "owner": self.owner,
+            "repo": self.repo,
+            "previous": f"refs/tags/{previous_tag_name}",
+            "current": current_ref,
+            "latest": previous_tag_name is None,
+        }
+        repository_json = self.graphql_query(RANGE_QUERY, variables, "range")["data"][
+            "repository"
+        ]
+
+        if previous_tag_name is None:
+            latest_refs = repository_json["latest"]["nodes"]
+            if not latest_refs:
+                raise GitHubError(f"No tags found in {self.owner}/{self.repo}.")
+            previous_ref_json = latest_refs[0]
+        else:
+            previous_ref_json = repository_json["previous"]
+
+        previous_commit = _ref_commit(previous_ref_json, variables["previous"])
+        previous_tag = Tag(previous_ref_json["name"], previous_commit)
+        current_commit = _ref_commit(repository_json["current"], current_ref)
+        if self.store is not None:
+            self.store.put_tag(self.owner, self.repo, previous_tag)
+            if current_tag_name is not None:
+                current_tag = Tag(current_tag_name, current_commit)
+                self.store.put_tag(self.owner, self.repo, current_tag)
+        return previous_tag, current_commit
+
+    def get_tags(self) -> List[Tag]:
+        """ Get every tag that points at a commit, with the commits resolved
+        in the same paginated query, oldest commit first """
+        tags = []
+        cursor = None
+        while True:
+            variables = {
+                "owner": self.owner,
+                "repo": self.repo,
+                "first": SEARCH_PAGE_SIZE,
+                "after": cursor,
+            }
+            refs_json = self.graphql_query(TAGS_QUERY, variables, "tags")["data"][
+                "repository"
+            ]["refs"]
+            for ref_json in refs_json["nodes"]:
+                # Tags can also point at trees and blobs
+                try:
+                    commit = _ref_commit(ref_json, ref_json["name"])
+                except GitHubError:
+                    continue
+                tags.append(Tag(ref_json["name"], commit))
+
+            if not refs_json["pageInfo"]["hasNextPage"]:
+                break
+            cursor = refs_json["pageInfo"]["endCursor"]
+        return sorted(tags, key=lambda tag: tag.commit.datetime)
+
     def get_commits_between(
-        self, first_commit: Commit, last_commit: Commit
-    ) -> List[Commit]:
-        """ Get a list of commits between two commits """
-        commits_json = self.api_query(
-            self.compare_commits_url(first_commit, last_commit)
-        )
+        self,
+        first_commit: Commit,
+        last_commit: Commit,
+        max_workers: int = MAX_WORKERS,
+    ) -> Iterator[Commit]:
+        """ Stream the commits between two commits, oldest first. Once the
+        first page gives the total, the remaining pages are requested
+        concurrently. """
+        compare_url = self.compare_commits_url(first_commit, last_commit)
+        commits_json = self._compare_page(compare_url, 1)
 
         if "commits" not in commits_json:
             raise GitHubError(
                 f"Commits not found between {first_commit} and {last_commit}."
             )
 
-        return [Commit.init_from_api(c) for c in commits_json["commits"]]
+        yield from map(Commit.init_from_api, commits_json["commits"])
+
+        page_count = math.ceil(commits_json["total_commits"] / COMPARE_PAGE_SIZE)
+        if page_count <= 1:
+            return
+        with _thread_pool(max_workers) as executor:
+            pages = [
+                executor.submit(self._compare_page, compare_url, page)
+                for page in range(2, page_count + 1)
+            ]
+            try:
+                for page in pages:
+                    yield from map(Commit.init_from_api, page.result()["commits"])
+            finally:
+                for page in pages:
+                    page.cancel()
+
+    def _compare_page(self, compare_url: str, page: int) -> Dict[str, Any]:
+        # Comparisons between two shas never change
+        return self.api_query(
+            compare_url,
+            params={"per_page": str(COMPARE_PAGE_SIZE), "page": str(page)},
+            immutable=True,
+        )
+
+    def is_ancestor(self, sha: str, head_sha: str) -> bool:
+        """ Whether a commit is ``head_sha`` or one of its ancestors. It isn't
+        once a branch has been force pushed past it. """
+        compare_url = f"{self.repo_url}/compare/{sha}...{head_sha}"
+        return self._compare_page(compare_url, 1)["status"] in ("ahead", "identical")
+
+    def get_pull_requests(self, numbers: Iterable[int]) -> Dict[int, PullRequest]:
+        """ Look up PRs by number, batching them into as few queries as
+        possible. Numbers that aren't PRs are left out. """
+        numbers = sorted(set(numbers))
+        prs = {}
+        if self.store is not None:
+            prs = self.store.get_pull_requests(self.owner, self.repo, numbers)
+            numbers = [number for number in numbers if number not in prs]
+
+        fetched = []
+        for start, end in _batch_bounds(len(numbers), PULL_REQUEST_BATCH_SIZE):
+            batch = numbers[start:end]
+            lookups = "\n    ".join(
+                f"pr{number}: pullRequest(number: {number}) {{ ...PullRequestFields }}"
+                for number in batch
+            )
+            repository_json = self.graphql_query(
+                PULL_REQUESTS_QUERY % lookups,
+                {"owner": self.owner, "repo": self.repo},
+                "pullRequests",
+            )["data"]["repository"]
+            for pr_json in repository_json.values():
+                if pr_json is not None:
+                    fetched.append(PullRequest.init_from_api(pr_json))
+
+        if self.store is not None:
+            self.store.put_pull_requests(self.owner, self.repo, fetched)
+        prs.update((pr.number, pr) for pr in fetched)
+        return prs
+
+    def get_prs_for_commits(
+        self, commits: Iterable[Commit], max_workers: int = MAX_WORKERS
+    ) -> List[PullRequest]:
+        """ Get the PRs merged by a set of commits, in PR number order. The
+        commits are mapped to their PRs in concurrent batched queries, so the
+        cost depends only on the number of commits. """
+        commits = list(commits)
+        shas = [commit.sha for commit in commits]
+        prs: Dict[int, PullRequest] = {}
+        if self.store is not None:
+            stored_prs, shas = self.store.get_prs_for_commits(
+                self.owner, self.repo, shas
+            )
+            prs.update((pr.number, pr) for pr in stored_prs)
+
+        merge_shas = set(shas)
+        batches = [
+            shas[start:end]
+            for start, end in _batch_bounds(len(shas), PULL_REQUEST_BATCH_SIZE)
+        ]
+
+        fetched = []
+        with _thread_pool(max_workers) as executor:
+            for batch_json in executor.map(self._associated_pull_requests, batches):
+                for commit_json in batch_json.values():
+                    if commit_json is None:
+                        continue
+                    for pr_json in commit_json["associatedPullRequests"]["nodes"]:
+                        pr = PullRequest.init_from_api(pr_json)
+                        if pr.merge_commit_sha in merge_shas:
+                            fetched.append(pr)
+
+        if self.store is not None:
+            self.store.put_prs_for_commits(
+                self.owner,
+                self.repo,
+                (commit for commit in commits if commit.sha in merge_shas),
+                fetched,
+            )
+        prs.update((pr.number, pr) for pr in fetched)
+        return sorted(prs.values(), key=attrgetter("number"))
+
+    def _associated_pull_requests(self, shas: List[str]) -> Dict[str, Any]:
+        lookups = "\n    ".join(
+            f'c{i}: object(oid: "{sha}") {{ ...AssociatedPullRequests }}'
+            for i, sha in enumerate(shas)
+        )
+        return self.graphql_query(
+            ASSOCIATED_PULL_REQUESTS_QUERY % lookups,
+            {"owner": self.owner, "repo": self.repo},
+            "associatedPullRequests",
+        )["data"]["repository"]
+
+    def search_pull_requests(
+        self, search_query: str, prefetch: bool = True
+    ) -> Iterator[PullRequest]:
+        """ Stream the PRs matching a search, following the pagination cursor """
+        yield from self._paginate_search(search_query, None, prefetch)
+
+    def search_pull_requests_between(
+        self,
+        qualifiers: str,
+        start: datetime,
+        end: datetime,
+        date_field: str = "created",
+        prefetch: bool = True,
+        max_workers: int = MAX_WORKERS,
+    ) -> Iterator[PullRequest]:
+        """ Stream the PRs whose ``date_field`` (``created`` or ``merged``)
+        falls in a date range, splitting the range into windows when it
+        exceeds the search cap. The first window is streamed page by page
+        while up to ``max_workers`` of the following ones are searched ahead
+        of it, so only that many windows of PRs are held at once. """
+        search_query = date_range_search_query(qualifiers, date_field, start, end)
+        search_json = self._search_page(search_query)
+        if search_json["issueCount"] <= SEARCH_RESULT_LIMIT:
+            yield from self._paginate_search(search_query, search_json, prefetch)
+            return
+
+        windows = plan_search_windows(start, end, search_json["issueCount"])
+        seen = set()
+        with _thread_pool(max_workers) as executor:
+            upcoming = iter(windows[1:])
+            ahead = deque()
+
+            def search_ahead() -> None:
+                window = next(upcoming, None)
+                if window is not None:
+                    ahead.append(
+                        executor.submit(
+                            self._collect_window, qualifiers, date_field, *window
+                        )
+                    )
+
+            def window_results() -> Iterator[Iterable[PullRequest]]:
+                yield self._search_window(
+                    qualifiers, date_field, *windows[0], prefetch=prefetch
+                )
+                while ahead:
+                    future = ahead.popleft()
+                    search_ahead()
+                    yield future.result()
+
+            for _ in range(max_workers):
+                search_ahead()
+            try:
+                for prs in window_results():
+                    for pr in prs:
+                        # Adjacent windows share their boundary second
+                        if pr.number not in seen:
+                            seen.add(pr.number)
+                            yield pr
+            finally:
+                for future in ahead:
+                    future.cancel()
+
+    def _search_window(
+        self,
+        qualifiers: str,
+        date_field: str,
+        start: datetime,
+        end: datetime,
+        prefetch: bool = False,
+    ) -> Iterator[PullRequest]:
+        search_query = date_range_search_query(qualifiers, date_field, start, end)
+        search_json = self._search_page(search_query)
+        result_count = search_json["issueCount"]
+        # The probe undercounted this part of the range, so split it using
+        # its own result count. A single second cannot be split any further.
+        if result_count > SEARCH_RESULT_LIMIT and (end - start).total_seconds() > 1:
+            for window in plan_search_windows(start, end, result_count):
+                yield from self._search_window(qualifiers, date_field, *window, prefetch)
+            return
+
+        yield from self._paginate_search(search_query, search_json, prefetch)
+
+    def _collect_window(
+        self, qualifiers: str, date_field: str, start: datetime, end: datetime
+    ) -> List[PullRequest]:
+        return list(self._search_window(qualifiers, date_field, start, end))
+
+    def _paginate_search(
+        self,
+        search_query: str,
+        search_json: Optional[Dict[str, Any]],
+        prefetch: bool,
+    ) -> Iterator[PullRequest]:
+        executor = _thread_pool(1) if prefetch else None
+        try:
+            if search_json is None:
+                search_json = self._search_page(search_query)
+            while True:
+                page_info = search_json["pageInfo"]
+                next_page = None
+                # Request the next page before parsing this one so the round
+                # trip overlaps with the consumer's work
+                if page_info["hasNextPage"] and executor is not None:
+                    next_page = executor.submit(
+                        self._search_page, search_query, page_info["endCursor"]
+                    )
+
+                for pr_json in search_json.get("nodes", []):
+                    yield PullRequest.init_from_api(pr_json)
+
+                if not page_info["hasNextPage"]:
+                    break
+                if next_page is not None:
+                    search_json = next_page.result()
+                else:
+                    search_json = self._search_page(
+                        search_query, page_info["endCursor"]
+                    )
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+    def _search_page(
+        self, search_query: str, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        variables = {
+            "query": search_query,
+            "first": SEARCH_PAGE_SIZE,
+            "after": cursor,
+        }
+        search_json = self.graphql_query(PR_SEARCH_QUERY, variables, "search")
+        return search_json["data"]["search"]
 
     def get_prs_merged_between_commits(
         self, first_commit: Commit, last_commit: Commit
     ) -> List[PullRequest]:
-        from_date = first_commit.datetime.isoformat()
-        to_date = last_commit.datetime.isoformat()
-        merged_query = f"repo:{self.owner}/{self.repo} is:pr is:merged created:{from_date}..{to_date}"
-        graphql_search = (
-            """
-            {
-              search(first: 100, query: "%s", type: ISSUE) {
-                nodes {
-                  ... on PullRequest {
-                    title
-                    number
-                    author { login }
-                  }
-                }
-              }
-            }
-            """
-            % merged_query
-        )
-        pr_json_list = self.graphql_query(graphql_search)
+        """ Get the PRs created between two commits, in PR number order """
         return sorted(
-            [
-                PullRequest(
-                    number=pr["number"], title=pr["title"], author=pr["author"]["login"]
-                )
-                for pr in pr_json_list["data"]["search"].get("nodes", [])
-            ],
+            self.iter_prs_merged_between_commits(first_commit, last_commit),
             key=attrgetter("number"),
         )
 
+    def iter_prs_merged_between_commits(
+        self, first_commit: Commit, last_commit: Commit, prefetch: bool = True
+    ) -> Iterator[PullRequest]:
+        """ Stream the PRs created between two commits, oldest first """
+        return self.search_pull_requests_between(
+            f"repo:{self.owner}/{self.repo} is:pr is:merged",
+            first_commit.datetime,
+            last_commit.datetime,
+            prefetch=prefetch,
+        )
+
 
 class GitHubError(Exception):
     pass
 
 
+class DeadlineExceeded(GitHubError):
+    pass
+
+
+class RateLimitError(GitHubError):
+    def __init__(self, message: str, resource: str):
+        super().__init__(message)
+        self.resource = resource
+
+
+def create_session(config: GitHubConfig) -> "requests.Session":
+    """ Create a pooled, keep-alive session for talking to the GitHub API,
+    using the configured transport. Without requests installed the standard
+    library's is used. """
+    session_config = config.session_config
+    if session_config.transport not in TRANSPORTS:
+        raise ValueError(f"Unknown transport {session_config.transport}")
+    transport = session_config.transport
+    if transport == "requests":
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+        except ImportError:
+            transport = "http.client"
+
+    if transport == "http.client":
+        from changelog.transport import HTTPClientTransport
+
+        session = HTTPClientTransport(pool_maxsize=session_config.pool_maxsize)
+    else:
+        adapter = HTTPAdapter(
+            pool_connections=session_config.pool_connections,
+            pool_maxsize=session_config.pool_maxsize,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    session.headers.update(github_headers(config))
+    if not session_config.keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def github_headers(config: GitHubConfig) -> Dict[str, str]:
+    """ The headers every request to the GitHub API is sent with """
+    headers = {"Accept": "application/vnd.github.v3+json"}
+    if config.authorization.token:
+        headers.update(config.authorization.token_auth)
+    return headers
+
+
+@lru_cache(maxsize=None)
+def retryable_exceptions() -> Tuple[type, ...]:
+    """ The exceptions a failed request is retried after """
+    import requests
+
+    return (
+        requests.ConnectionError,
+        requests.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+    )
+
+
 def parse_datetime_string(datetime_str: str):
     return datetime.fromisoformat(datetime_str.replace("Z", "+00:00"))
 
 
+def _thread_pool(max_workers: int) -> "ThreadPoolExecutor":
+    from concurrent.futures import ThreadPoolExecutor
+
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+def _batch_bounds(length: int, batch_size: int) -> Iterator[Tuple[int, int]]:
+    for start in range(0, length, batch_size):
+        yield start, min(start + batch_size, length)
+
+
+def _graphql_cost(result: Any) -> Optional[int]:
+    """ The rate limit points a GraphQL response says its query cost """
+    if not isinstance(result, dict):
+        return None
+    rate_limit = (result.get("data") or {}).get("rateLimit")
+    return rate_limit["cost"] if rate_limit else None
+
+
+def _ref_commit(ref_json: Optional[Dict[str, Any]], ref: str) -> Commit:
+    if ref_json is None:
+        raise GitHubError(f"{ref} not found.")
+
+    target = ref_json["target"]
+    # Annotated tags point at a tag object rather than at the commit
+    if "target" in target:
+        target = target["target"]
+    if "oid" not in target:
+        raise GitHubError(f"{ref} does not point at a commit.")
+    return Commit.init_from_graphql(target)
+
+
+def date_range_search_query(
+    qualifiers: str, date_field: str, start: datetime, end: datetime
+) -> str:
+    # Sorting by creation keeps the stream in PR number order without having
+    # to buffer every page
+    from_date = start.isoformat(timespec="seconds")
+    to_date = end.isoformat(timespec="seconds")
+    return f"{qualifiers} {date_field}:{from_date}..{to_date} sort:created-asc"
+
+
+def plan_search_windows(
+    start: datetime,
+    end: datetime,
+    result_count: int,
+    limit: int = SEARCH_RESULT_LIMIT,
+) -> List[Tuple[datetime, datetime]]:
+    """ Split a date range into windows expected to hold fewer than ``limit``
+    results each, assuming the results are spread evenly over the range """
+    window_count = max(2, math.ceil(result_count / (limit * SEARCH_WINDOW_FILL)))
+    step = max((end - start) / window_count, timedelta(seconds=1))
+    windows = []
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + step, end)
+        windows.append((window_start, window_end))
+        window_start = window_end
+    return windows
+
+
 def fetch_changes(
     github_api: GithubAPI,
     previous_tag_name: Optional[str] = None,
     current_tag_name: Optional[str] = None,
     branch: str = "master",
-):
+    use_graphql: bool = False,
+    ancestry: bool = False,
+) -> List[PullRequest]:
+    """ Get the PRs merged between the previous tag and the current tag (or
+    the head of the branch), in PR number order. By default PRs are picked by
+    their creation date falling between the two commits. With ``ancestry``
+    they are picked by their merge commit being one of the commits between
+    the two. """
+    prs = iter_changes_from(
+        github_api, previous_tag_name, current_tag_name, branch, use_graphql, ancestry
+    )
+    return sorted(prs, key=attrgetter("number"))
+
+
+def iter_changes_from(
+    github_api: GithubAPI,
+    previous_tag_name: Optional[str] = None,
+    current_tag_name: Optional[str] = None,
+    branch: str = "master",
+    use_graphql: bool = False,
+    ancestry: bool = False,
+) -> Iterator[PullRequest]:
+    """ Like :func:`fetch_changes`, but streams the PRs as the search results
+    arrive, oldest first, so the first can be written before the last has
+    been fetched """
+    if use_graphql:
+        previous_tag, current_commit = github_api.resolve_range(
+            previous_tag_name, current_tag_name, branch=branch
+        )
+    else:
+        previous_tag, current_commit = resolve_range_rest(
+            github_api, previous_tag_name, current_tag_name, branch=branch
+        )
+
+    if ancestry:
+        commits = github_api.get_commits_between(previous_tag.commit, current_commit)
+        return iter(github_api.get_prs_for_commits(commits))
+    return github_api.iter_prs_merged_between_commits(
+        first_commit=previous_tag.commit, last_commit=current_commit
+    )
+
+
+def resolve_range_rest(
+    github_api: GithubAPI,
+    previous_tag_name: Optional[str] = None,
+    current_tag_name: Optional[str] = None,
+    branch: str = "master",
+) -> Tuple[Tag, Commit]:
+    """ Get the previous tag and the current tag's commit (or the branch
+    head) through the REST API """
     if previous_tag_name is None:
-        previous_tag_name = github_api.get_latest_tag()
-    previous_tag = github_api.get_tag(previous_tag_name)
+        previous_tag = github_api.get_latest_tag()
+    else:
+        previous_tag = github_api.get_tag(previous_tag_name)
 
     if current_tag_name is not None:
         current_tag = github_api.get_tag(current_tag_name)
         current_commit = current_tag.commit
     else:
         current_commit = github_api.get_last_commit(branch=branch)
+    return previous_tag, current_commit
 
-    return github_api.get_prs_merged_between_commits(
-        first_commit=previous_tag.commit, last_commit=current_commit
+
+def fetch_release_changes(
+    github_api: GithubAPI, ancestry: bool = False
+) -> List[Release]:
+    """ Get the PRs merged in every release, oldest release first.
+
+    The tags are listed once and the PRs merged between the oldest and newest
+    tag are found in a single search. Each PR is then put in the release of
+    the first tag made after it was merged or, with ``ancestry``, the release
+    whose commits include its merge commit. """
+    tags = github_api.get_tags()
+    if len(tags) < 2:
+        return []
+
+    tag_dates = [tag.commit.datetime for tag in tags]
+    release_of_commit: Dict[str, int] = {}
+    if ancestry:
+        with _thread_pool(MAX_WORKERS) as executor:
+            release_commits = executor.map(
+                lambda first, last: [
+                    commit.sha
+                    for commit in github_api.get_commits_between(first.commit, last.commit)
+                ],
+                tags,
+                tags[1:],
+            )
+            for index, shas in enumerate(release_commits, start=1):
+                for sha in shas:
+                    release_of_commit.setdefault(sha, index)
+
+    buckets: List[List[PullRequest]] = [[] for _ in tags]
+    prs = github_api.search_pull_requests_between(
+        f"repo:{github_api.owner}/{github_api.repo} is:pr is:merged",
+        tag_dates[0],
+        tag_dates[-1],
+        date_field="merged",
     )
+    for pr in prs:
+        if ancestry:
+            index = release_of_commit.get(pr.merge_commit_sha, 0)
+        elif pr.merged_at is not None:
+            index = bisect_left(tag_dates, pr.merged_at)
+        else:
+            continue
+        # Index 0 holds PRs merged before the oldest tag
+        if 0 < index < len(tags):
+            buckets[index].append(pr)
+
+    return [
+        Release(
+            previous_tag=tags[index - 1],
+            tag=tags[index],
+            prs=tuple(sorted(buckets[index], key=attrgetter("number"))),
+        )
+        for index in range(1, len(tags))
+    ]
+
+
+def iter_changes(
+    base_url: str,
+    owner: str,
+    repo: str,
+    prs: Iterable[PullRequest],
+    categories: Optional[Mapping[str, str]] = None,
+) -> Iterator[str]:
+    """ Format PRs in ReStructuredText as they arrive. Each bullet is yielded
+    as soon as its PR is, the link targets follow the last one. Grouping
+    them by ``categories``, a map of label names to headings, means waiting
+    for the last PR first. """
+    renderer = RstRenderer(base_url, owner, repo)
+    return iter_rendered(renderer, [(None, None, prs)], categories)
 
 
 def format_changes(
-    base_url: str, owner: str, repo: str, prs: List[PullRequest]
+    base_url: str,
+    owner: str,
+    repo: str,
+    prs: Iterable[PullRequest],
+    categories: Optional[Mapping[str, str]] = None,
 ) -> List[str]:
-    """ Format the list of PRs in ReStructuredText"""
-    bullet_list = []
-    url_list = []
-    for pr in prs:
-        bullet_list.append(f"- `#{pr.number}`_ {pr.title} (@{pr.author})")
-        url_list.append(f".. _#{pr.number}: {base_url}/{owner}/{repo}/pull/{pr.number}")
+    """ Format the list of PRs in ReStructuredText, grouped under a heading
+    per category if a map of label names to categories is given """
+    return list(iter_changes(base_url, owner, repo, prs, categories))
+
+
+def release_sections(releases: Iterable[Release]) -> List[Section]:
+    """ A section per release, newest first """
+    sorted_releases = sorted(
+        releases, key=lambda r: r.tag.commit.datetime, reverse=True
+    )
+    return [
+        (release.tag.name, release.tag.commit.datetime, release.prs)
+        for release in sorted_releases
+    ]
+
+
+def iter_releases(
+    base_url: str,
+    owner: str,
+    repo: str,
+    releases: Iterable[Release],
+    categories: Optional[Mapping[str, str]] = None,
+) -> Iterator[str]:
+    """ Format a section per release in ReStructuredText, newest first """
+    renderer = RstRenderer(base_url, owner, repo)
+    return iter_rendered(renderer, release_sections(releases), categories)
 
-    return bullet_list + url_list
+
+def format_releases(
+    base_url: str,
+    owner: str,
+    repo: str,
+    releases: Iterable[Release],
+    categories: Optional[Mapping[str, str]] = None,
+) -> List[str]:
+    """ Format a section per release in ReStructuredText, newest first """
+    return list(iter_releases(base_url, owner, repo, releases, categories))
 
 
 def generate_changelog(
@@ -245,23 +1362,238 @@ def generate_changelog(
     github_base_url=None,
     github_api_url=None,
     github_token=None,
+    cache_dir=None,
+    graphql=False,
+    timeout=None,
+    git_dir=None,
+    ancestry=False,
+    all_releases=False,
+    state_file=None,
+    metadata_db=None,
+    categories=None,
+    request_hooks=(),
+    transport="requests",
 ):
+    lines = iter_changelog(
+        owner,
+        repo,
+        github_base_url=github_base_url,
+        categories=categories,
+        previous_tag=previous_tag,
+        current_tag=current_tag,
+        github_api_url=github_api_url,
+        github_token=github_token,
+        cache_dir=cache_dir,
+        graphql=graphql,
+        timeout=timeout,
+        git_dir=git_dir,
+        ancestry=ancestry,
+        all_releases=all_releases,
+        state_file=state_file,
+        metadata_db=metadata_db,
+        request_hooks=request_hooks,
+        transport=transport,
+    )
+    separator = "\\n" if single_line else "\n"
+    return separator.join(lines)
+
+
+def iter_changelog(
+    owner, repo, github_base_url=None, output_format="rst", categories=None, **kwargs
+) -> Iterator[str]:
+    """ Generate a changelog line by line in one of the :data:`RENDERERS`
+    formats, yielding each PR's line as soon as the page of results it is
+    on arrives. The other arguments are those of :func:`changelog_sections`. """
+    renderer = RENDERERS[output_format](
+        github_base_url, owner, repo, kwargs.get("current_tag")
+    )
+    sections = changelog_sections(owner, repo, **kwargs)
+    return iter_rendered(renderer, sections, categories)
+
+
+def changelog_sections(
+    owner,
+    repo,
+    previous_tag=None,
+    current_tag=None,
+    github_api_url=None,
+    github_token=None,
+    cache_dir=None,
+    graphql=False,
+    timeout=None,
+    git_dir=None,
+    ancestry=False,
+    all_releases=False,
+    state_file=None,
+    metadata_db=None,
+    request_hooks=(),
+    transport="requests",
+) -> Iterator[Section]:
+    """ Fetch the sections of a changelog, a single one or one per release
+    with ``all_releases``. A section's PRs are streamed, and have to be read
+    before the next section is asked for. Every request made is reported to
+    each of the ``request_hooks``. """
     github_config = GitHubConfig(
         api_url=github_api_url,
         authorization=Authorization(github_token),
+        session_config=SessionConfig(transport=transport),
     )
-    github_api = GithubAPI(github_config, owner, repo)
+    cache = ResponseCache(cache_dir) if cache_dir is not None else None
+    store = None
+    if metadata_db is not None:
+        from changelog.store import MetadataStore
+
+        store = MetadataStore(metadata_db)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    try:
+        with GithubAPI(
+            github_config,
+            owner,
+            repo,
+            cache=cache,
+            deadline=deadline,
+            store=store,
+            request_hooks=tuple(request_hooks),
+        ) as github_api:
+            if all_releases:
+                releases = fetch_release_changes(github_api, ancestry=ancestry)
+                yield from release_sections(releases)
+            elif state_file is not None and current_tag is None and git_dir is None:
+                from changelog.incremental import (
+                    WatermarkStore,
+                    fetch_unreleased_changes,
+                )
 
-    prs = fetch_changes(
-        github_api, previous_tag_name=previous_tag, current_tag_name=current_tag
+                prs = fetch_unreleased_changes(
+                    github_api,
+                    WatermarkStore(state_file),
+                    previous_tag_name=previous_tag,
+                    use_graphql=graphql,
+                    ancestry=ancestry,
+                )
+                yield None, None, prs
+            else:
+                backend = github_api
+                if git_dir is not None:
+                    from changelog.local import LocalGitBackend
+
+                    backend = LocalGitBackend(git_dir, github_api=github_api)
+                prs = iter_changes_from(
+                    backend,
+                    previous_tag_name=previous_tag,
+                    current_tag_name=current_tag,
+                    use_graphql=graphql,
+                    ancestry=ancestry,
+                )
+                yield None, None, prs
+    finally:
+        if store is not None:
+            store.close()
+
+
+def add_github_arguments(parser: "argparse.ArgumentParser") -> None:
+    """ Add the options for reaching GitHub and picking PRs shared by every
+    command """
+    parser.add_argument(
+        "--github-base-url",
+        type=str,
+        default=PUBLIC_GITHUB_URL,
+        help="Override if you are using GitHub Enterprise. e.g. https://github.my-company.com",
+    )
+    parser.add_argument(
+        "--github-api-url",
+        type=str,
+        default=PUBLIC_GITHUB_API_URL,
+        help="Override if you are using GitHub Enterprise. e.g. https://github.my-company.com/api/v3",
+    )
+    parser.add_argument(
+        "--github-token",
+        type=str,
+        default=os.environ.get("GITHUB_API_TOKEN"),
+        help="GitHub oauth token to auth your Github requests with",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="directory to cache GitHub API responses in between runs",
+    )
+    parser.add_argument(
+        "--metadata-db",
+        type=str,
+        default=None,
+        help="SQLite database of the tags, commits and merged PRs already seen, "
+        "consulted before asking GitHub",
+    )
+    parser.add_argument(
+        "--graphql",
+        action="store_true",
+        help="resolve both tags with a single GraphQL query instead of the REST API",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="give up if the changelog takes longer than this many seconds",
+    )
+    parser.add_argument(
+        "--ancestry",
+        action="store_true",
+        help="pick the PRs whose merge commits are between the two tags, rather "
+        "than the PRs created between the tags' commit dates",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=TRANSPORTS,
+        default="requests",
+        help="make requests with the requests package or the standard library's "
+        "http.client (default requests, or http.client if it isn't installed)",
     )
-    lines = format_changes(github_base_url, owner, repo, prs)
 
-    separator = "\\n" if single_line else "\n"
-    return separator.join(lines)
+
+def parse_formats(
+    parser: "argparse.ArgumentParser",
+    format_args: Optional[List[str]],
+    output: Optional[str],
+) -> List[Tuple[str, Optional[str]]]:
+    """ Split ``--format`` values of the form ``FORMAT[=PATH]`` """
+    formats = []
+    for format_arg in format_args or ["rst"]:
+        output_format, _, path = format_arg.partition("=")
+        if output_format not in RENDERERS:
+            parser.error(
+                f"unknown format {output_format}, choose from {', '.join(RENDERERS)}"
+            )
+        formats.append((output_format, path or None))
+
+    if output is not None:
+        if len(formats) > 1:
+            parser.error("give each format its own path instead of using --output")
+        formats = [(formats[0][0], output)]
+    if sum(path is None for _, path in formats) > 1:
+        parser.error("only one format can be written to stdout, give the others a path")
+    return formats
+
+
+def parse_categories(
+    parser: "argparse.ArgumentParser", category_args: Optional[List[str]]
+) -> Optional[Dict[str, str]]:
+    """ Turn ``--category`` values of the form ``LABEL=HEADING`` into a map,
+    keeping the order they were given in """
+    if not category_args:
+        return None
+    categories = {}
+    for category_arg in category_args:
+        label, _, heading = category_arg.partition("=")
+        if not label or not heading:
+            parser.error(f"expected --category LABEL=HEADING, got {category_arg}")
+        categories[label] = heading
+    return categories
 
 
 def main():
+    import argparse
+
     parser = argparse.ArgumentParser(
         description="Generate a CHANGELOG between two git tags based on GitHub"
         "Pull Request merge commit messages"
@@ -287,28 +1619,103 @@ def main():
         help="output as single line joined by \\n characters",
     )
     parser.add_argument(
-        "--github-base-url",
+        "-o",
+        "--output",
         type=str,
-        default=PUBLIC_GITHUB_URL,
-        help="Override if you are using GitHub Enterprise. e.g. https://github.my-company.com",
+        default=None,
+        help="write the changelog to this file instead of stdout",
     )
     parser.add_argument(
-        "--github-api-url",
+        "-f",
+        "--format",
+        action="append",
+        metavar="FORMAT[=PATH]",
+        help=f"output format, one of {', '.join(RENDERERS)} (default rst). Repeat "
+        "to write several formats from one run, each to its own PATH",
+    )
+    parser.add_argument(
+        "-m",
+        "--markdown",
+        action="append_const",
+        dest="format",
+        const="markdown",
+        help="same as --format markdown",
+    )
+    parser.add_argument(
+        "-c",
+        "--category",
+        action="append",
+        metavar="LABEL=HEADING",
+        help="group PRs labelled LABEL under HEADING. Repeat for each label, "
+        "PRs with none of them go last under 'Other changes'",
+    )
+    add_github_arguments(parser)
+    parser.add_argument(
+        "--git-dir",
         type=str,
-        default=PUBLIC_GITHUB_API_URL,
-        help="Override if you are using GitHub Enterprise. e.g. https://github.my-company.com/api/v3",
+        default=None,
+        help="read tags and merged PRs from this local clone, only asking GitHub "
+        "for PR titles and authors the commits don't record",
     )
     parser.add_argument(
-        "--github-token",
+        "--all-releases",
+        action="store_true",
+        help="generate a section for every pair of consecutive tags",
+    )
+    parser.add_argument(
+        "--state-file",
         type=str,
-        default=os.environ.get("GITHUB_API_TOKEN"),
-        help="GitHub oauth token to auth your Github requests with",
+        default=None,
+        help="remember the PRs found since the previous tag in this file, so the "
+        "next run without a CURRENT tag only looks for newly merged PRs",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="print a waterfall of the requests made to stderr at exit",
+    )
+    parser.add_argument(
+        "--trace-file",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="save the requests made to PATH as a JSON trace at exit",
     )
 
     args = parser.parse_args()
+    if args.all_releases and (args.previous_tag or args.current_tag):
+        parser.error("--all-releases covers every tag, don't pass PREVIOUS or CURRENT")
+    if args.all_releases and args.git_dir:
+        parser.error("--all-releases can't be used with --git-dir")
 
-    changelog = generate_changelog(**vars(args))
-    print(changelog)
+    kwargs = vars(args)
+    single_line = kwargs.pop("single_line")
+    github_base_url = kwargs.pop("github_base_url")
+    formats = parse_formats(parser, kwargs.pop("format"), kwargs.pop("output"))
+    categories = parse_categories(parser, kwargs.pop("category"))
+    waterfall = kwargs.pop("trace")
+    trace_path = kwargs.pop("trace_file")
+    recorder = TraceRecorder() if waterfall or trace_path else None
+    if recorder is not None:
+        kwargs["request_hooks"] = (recorder,)
+
+    try:
+        with ExitStack() as stack:
+            outputs = []
+            for output_format, path in formats:
+                renderer = RENDERERS[output_format](
+                    github_base_url, args.owner, args.repo, args.current_tag
+                )
+                f = sys.stdout if path is None else stack.enter_context(open(path, "w"))
+                outputs.append((renderer, f))
+            sections = changelog_sections(**kwargs)
+            write_rendered(outputs, sections, single_line, categories)
+    finally:
+        # Slow or failed runs are the ones worth tracing
+        if waterfall:
+            print("\n".join(recorder.waterfall()), file=sys.stderr)
+        if trace_path:
+            recorder.write_json(trace_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+An asyncio front end to the GitHub API client, for use from event loops that
+must not be blocked by the changelog's HTTP calls.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from changelog import (
+    Commit,
+    GitHubConfig,
+    GithubAPI,
+    PullRequest,
+    Tag,
+)
+from changelog.cache import ResponseCache
+from changelog.ratelimit import RateLimiter
+from changelog.tracing import RequestHook
+
+if TYPE_CHECKING:
+    import requests
+
+    from changelog.store import MetadataStore
+
+T = TypeVar("T")
+
+
+class AsyncGithubAPI:
+    """ Mirrors :class:`GithubAPI` with coroutine methods.
+
+    Requests are made by a :class:`GithubAPI` on a private thread pool as big
+    as the session's connection pool, so concurrent calls share pooled
+    keep-alive connections and the event loop is never blocked. """
+
+    def __init__(
+        self,
+        config: GitHubConfig,
+        owner: str,
+        repo: str,
+        session: Optional["requests.Session"] = None,
+        cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        deadline: Optional[float] = None,
+        store: Optional["MetadataStore"] = None,
+        request_hooks: Sequence[RequestHook] = (),
+    ):
+        self.sync_api = GithubAPI(
+            config,
+            owner,
+            repo,
+            session=session,
+            cache=cache,
+            rate_limiter=rate_limiter,
+            deadline=deadline,
+            store=store,
+            request_hooks=tuple(request_hooks),
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.session_config.pool_maxsize,
+            thread_name_prefix="changelog",
+        )
+
+    @property
+    def config(self) -> GitHubConfig:
+        return self.sync_api.config
+
+    @property
+    def owner(self) -> str:
+        return self.sync_api.owner
+
+    @property
+    def repo(self) -> str:
+        return self.sync_api.repo
+
+    async def __aenter__(self) -> "AsyncGithubAPI":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """ Wait for outstanding requests, then release the pooled connections """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown)
+        self.sync_api.close()
+
+    async def _run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def graphql_query(
+        self,
+        query: str,
+        variables: Optional[Dict[str, Any]] = None,
+        name: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        return await self._run(self.sync_api.graphql_query, query, variables, name)
+
+    async def api_query(
+        self,
+        url: str,
+        params: Optional[Dict[str, str]] = None,
+        immutable: bool = False,
+    ) -> Any:
+        return await self._run(self.sync_api.api_query, url, params, immutable)
+
+    async def get_tag(self, name: str) -> Tag:
+        """ Get the commit sha for a given git tag """
+        return await self._run(self.sync_api.get_tag, name)
+
+    async def get_last_commit(self, branch: str = "master") -> Commit:
+        """ Get the last commit sha for the given repo and branch """
+        return await self._run(self.sync_api.get_last_commit, branch)
+
+    async def get_latest_tag(self) -> Tag:
+        """ Get the last tag for the given repo """
+        return await self._run(self.sync_api.get_latest_tag)
+
+    async def resolve_range(
+        self,
+        previous_tag_name: Optional[str] = None,
+        current_tag_name: Optional[str] = None,
+        branch: str = "master",
+    ) -> Tuple[Tag, Commit]:
+        """ Get both ends of a range in a single GraphQL query """
+        return await self._run(
+            self.sync_api.resolve_range, previous_tag_name, current_tag_name, branch
+        )
+
+    async def get_commits_between(
+        self, first_commit: Commit, last_commit: Commit
+    ) -> List[Commit]:
+        """ Get a list of commits between two commits """
+        commits = self.sync_api.get_commits_between(first_commit, last_commit)
+        return await self._run(list, commits)
+
+    async def get_prs_for_commits(self, commits: Iterable[Commit]) -> List[PullRequest]:
+        """ Get the PRs merged by a set of commits, in PR number order """
+        return await self._run(self.sync_api.get_prs_for_commits, commits)
+
+    async def get_prs_merged_between_commits(
+        self, first_commit: Commit, last_commit: Commit
+    ) -> List[PullRequest]:
+        """ Get the PRs created between two commits, in PR number order """
+        return await self._run(
+            self.sync_api.get_prs_merged_between_commits, first_commit, last_commit
+        )
+
+
+async def fetch_changes(
+    github_api: AsyncGithubAPI,
+    previous_tag_name: Optional[str] = None,
+    current_tag_name: Optional[str] = None,
+    branch: str = "master",
+    use_graphql: bool = False,
+    ancestry: bool = False,
+) -> List[PullRequest]:
+    """ Like :func:`changelog.fetch_changes`, but resolves both ends of the
+    range concurrently """
+    if use_graphql:
+        previous_tag, current_commit = await github_api.resolve_range(
+            previous_tag_name, current_tag_name, branch=branch
+        )
+        previous_commit = previous_tag.commit
+    else:
+        previous_commit, current_commit = await _resolve_concurrently(
+            github_api, previous_tag_name, current_tag_name, branch
+        )
+
+    if ancestry:
+        commits = await github_api.get_commits_between(previous_commit, current_commit)
+        return await github_api.get_prs_for_commits(commits)
+    return await github_api.get_prs_merged_between_commits(
+        first_commit=previous_commit, last_commit=current_commit
+    )
+
+
+async def _resolve_concurrently(
+    github_api: AsyncGithubAPI,
+    previous_tag_name: Optional[str],
+    current_tag_name: Optional[str],
+    branch: str,
+) -> Tuple[Commit, Commit]:
+    if previous_tag_name is None:
+        previous_tag = github_api.get_latest_tag()
+    else:
+        previous_tag = github_api.get_tag(previous_tag_name)
+
+    if current_tag_name is not None:
+        current_commit = _tag_commit(github_api.get_tag(current_tag_name))
+    else:
+        current_commit = github_api.get_last_commit(branch=branch)
+
+    previous_commit, current_commit = await asyncio.gather(
+        _tag_commit(previous_tag), current_commit
+    )
+    return previous_commit, current_commit
+
+
+async def _tag_commit(tag: Awaitable[Tag]) -> Commit:
+    return (await tag).commit
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Generate changelogs for many repositories at once, sharing one connection
+pool and one rate limit budget between them.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from changelog import (
+    MAX_WORKERS,
+    PUBLIC_GITHUB_API_URL,
+    PUBLIC_GITHUB_URL,
+    Authorization,
+    GitHubConfig,
+    GithubAPI,
+    SessionConfig,
+    add_github_arguments,
+    create_session,
+    fetch_changes,
+    format_changes,
+)
+from changelog.cache import ResponseCache
+from changelog.ratelimit import RateLimiter
+from changelog.store import MetadataStore
+
+DEFAULT_WORKERS = 8
+
+
+@dataclass(frozen=True)
+class ChangelogJob:
+    owner: str
+    repo: str
+    previous_tag: Optional[str] = None
+    current_tag: Optional[str] = None
+    branch: str = "master"
+
+    @classmethod
+    def init_from_manifest(cls, job_json: Dict[str, Any]) -> "ChangelogJob":
+        return ChangelogJob(
+            owner=job_json["owner"],
+            repo=job_json["repo"],
+            previous_tag=job_json.get("previous_tag"),
+            current_tag=job_json.get("current_tag"),
+            branch=job_json.get("branch", "master"),
+        )
+
+    @property
+    def name(self) -> str:
+        return f"{self.owner}/{self.repo}"
+
+
+@dataclass(frozen=True)
+class ChangelogResult:
+    job: ChangelogJob
+    lines: Optional[List[str]] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def generate_changelogs(
+    jobs: Iterable[ChangelogJob],
+    github_base_url: str = PUBLIC_GITHUB_URL,
+    github_api_url: str = PUBLIC_GITHUB_API_URL,
+    github_token: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    metadata_db: Optional[str] = None,
+    graphql: bool = False,
+    timeout: Optional[float] = None,
+    ancestry: bool = False,
+    max_workers: int = DEFAULT_WORKERS,
+    transport: str = "requests",
+) -> Iterator[ChangelogResult]:
+    """ Generate the changelog for every job on a pool of ``max_workers``
+    threads, yielding each result as soon as it is ready. Every job shares
+    one connection pool, response cache, metadata store and rate limiter. A
+    job that fails is yielded with its error rather than stopping the others.
+
+    ``timeout`` applies to each job separately. """
+    github_config = GitHubConfig(
+        api_url=github_api_url,
+        authorization=Authorization(github_token),
+        # Each job can have a few requests of its own in flight at once
+        session_config=SessionConfig(
+            pool_maxsize=max_workers * MAX_WORKERS, transport=transport
+        ),
+    )
+    session = create_session(github_config)
+    cache = ResponseCache(cache_dir) if cache_dir is not None else None
+    store = MetadataStore(metadata_db) if metadata_db is not None else None
+    rate_limiter = RateLimiter()
+
+    def run(job: ChangelogJob) -> ChangelogResult:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        github_api = GithubAPI(
+            github_config,
+            job.owner,
+            job.repo,
+            session=session,
+            cache=cache,
+            rate_limiter=rate_limiter,
+            deadline=deadline,
+            store=store,
+        )
+        try:
+            prs = fetch_changes(
+                github_api,
+                previous_tag_name=job.previous_tag,
+                current_tag_name=job.current_tag,
+                branch=job.branch,
+                use_graphql=graphql,
+                ancestry=ancestry,
+            )
+            lines = format_changes(github_base_url, job.owner, job.repo, prs)
+        except Exception as e:
+            return ChangelogResult(job, error=e)
+        return ChangelogResult(job, lines=lines)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(run, job) for job in jobs]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+    finally:
+        session.close()
+        if store is not None:
+            store.close()
+
+
+def read_manifest(path: str) -> List[ChangelogJob]:
+    """ Read a JSON list of jobs, each with an ``owner`` and ``repo`` and
+    optionally a ``previous_tag``, ``current_tag`` and ``branch`` """
+    with open(path) as f:
+        return [ChangelogJob.init_from_manifest(job_json) for job_json in json.load(f)]
+
+
+def write_result(result: ChangelogResult, output_dir: Optional[str]) -> None:
+    if not result.ok:
+        print(f"{result.job.name}: {result.error}", file=sys.stderr)
+        return
+
+    changelog = "\n".join(result.lines)
+    if output_dir is None:
+        print(f"{result.job.name}\n{changelog}\n", flush=True)
+        return
+
+    path = os.path.join(output_dir, result.job.owner, f"{result.job.repo}.rst")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(changelog + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate CHANGELOGs for every repo listed in a manifest"
+    )
+    parser.add_argument(
+        "manifest",
+        metavar="MANIFEST",
+        help="JSON list of {owner, repo, previous_tag, current_tag, branch} "
+        "objects, the tags and branch being optional",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=str,
+        default=None,
+        help="write each changelog to OUTPUT_DIR/OWNER/REPO.rst instead of stdout",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="how many repos to work on at once",
+    )
+    add_github_arguments(parser)
+    args = parser.parse_args()
+
+    jobs = read_manifest(args.manifest)
+    results = generate_changelogs(
+        jobs,
+        github_base_url=args.github_base_url,
+        github_api_url=args.github_api_url,
+        github_token=args.github_token,
+        cache_dir=args.cache_dir,
+        metadata_db=args.metadata_db,
+        graphql=args.graphql,
+        timeout=args.timeout,
+        ancestry=args.ancestry,
+        max_workers=args.workers,
+        transport=args.transport,
+    )
+    failures = 0
+    for result in results:
+        write_result(result, args.output_dir)
+        failures += not result.ok
+
+    if failures:
+        print(f"{failures} of {len(jobs)} changelogs failed", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
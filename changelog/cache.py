@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+An on-disk cache of GitHub API responses, bounded in size and evicted in
+least recently used order.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+DEFAULT_CACHE_SIZE = 100 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: Any
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @property
+    def validators(self) -> Dict[str, str]:
+        """ Headers that ask GitHub to reply 304 if the response is unchanged """
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """ Stores one JSON file per URL and query parameters under ``directory``.
+
+    Reading an entry refreshes its modification time, so once the directory
+    grows past ``max_size`` bytes the entries read least recently are removed
+    first. Files are replaced atomically, so several processes can share a
+    directory. """
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def get(
+        self, url: str, params: Optional[Dict[str, str]] = None
+    ) -> Optional[CachedResponse]:
+        path = self._path(url, params)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return CachedResponse(
+            body=entry["body"],
+            etag=entry.get("etag"),
+            last_modified=entry.get("last_modified"),
+        )
+
+    def set(
+        self,
+        url: str,
+        params: Optional[Dict[str, str]],
+        response: CachedResponse,
+    ) -> None:
+        entry = {
+            "url": url,
+            "params": params,
+            "etag": response.etag,
+            "last_modified": response.last_modified,
+            "body": response.body,
+        }
+        data = json.dumps(entry).encode("utf-8")
+        path = self._path(url, params)
+        with self._lock:
+            size = self._current_size()
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            self._size = size + len(data)
+            if self._size > self.max_size:
+                self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            for path, _, _ in self._entries():
+                _remove(path)
+            self._size = 0
+
+    def _path(self, url: str, params: Optional[Dict[str, str]]) -> str:
+        key = json.dumps([url, sorted((params or {}).items())])
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _entries(self) -> Iterator[Tuple[str, int, float]]:
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def _current_size(self) -> int:
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        return self._size
+
+    def _evict(self) -> None:
+        # Rescan rather than trust the running total, other processes may
+        # have written to the same directory
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        size = sum(size for _, size, _ in entries)
+        for path, entry_size, _ in entries:
+            if size <= self.max_size:
+                break
+            if _remove(path):
+                size -= entry_size
+        self._size = size
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Keep the unreleased section of a changelog up to date by only asking GitHub
+about the PRs merged since it was last generated.
+"""
+import json
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from changelog import (
+    Commit,
+    GitHubError,
+    GithubAPI,
+    PullRequest,
+    Tag,
+    parse_datetime_string,
+    resolve_range_rest,
+)
+
+
+@dataclass(frozen=True)
+class Watermark:
+    base_tag: str
+    base_sha: str
+    head_sha: str
+    head_datetime: datetime
+    ancestry: bool
+    prs: Tuple[PullRequest, ...]
+
+    @classmethod
+    def init_from_json(cls, watermark_json: Dict[str, Any]) -> "Watermark":
+        return Watermark(
+            base_tag=watermark_json["base_tag"],
+            base_sha=watermark_json["base_sha"],
+            head_sha=watermark_json["head_sha"],
+            head_datetime=parse_datetime_string(watermark_json["head_datetime"]),
+            ancestry=watermark_json["ancestry"],
+            prs=tuple(_pr_from_json(pr_json) for pr_json in watermark_json["prs"]),
+        )
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "base_tag": self.base_tag,
+            "base_sha": self.base_sha,
+            "head_sha": self.head_sha,
+            "head_datetime": self.head_datetime.isoformat(),
+            "ancestry": self.ancestry,
+            "prs": [_pr_to_json(pr) for pr in self.prs],
+        }
+
+
+class WatermarkStore:
+    """ A JSON file holding a watermark for each repo and branch. Writes
+    replace the file atomically so readers never see a partial file. """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self._watermarks = json.load(f)
+        except FileNotFoundError:
+            self._watermarks = {}
+
+    @staticmethod
+    def key(github_api: GithubAPI, branch: str) -> str:
+        return f"{github_api.owner}/{github_api.repo}@{branch}"
+
+    def get(self, key: str) -> Optional[Watermark]:
+        with self._lock:
+            watermark_json = self._watermarks.get(key)
+        if watermark_json is None:
+            return None
+        return Watermark.init_from_json(watermark_json)
+
+    def set(self, key: str, watermark: Watermark) -> None:
+        with self._lock:
+            self._watermarks[key] = watermark.to_json()
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._watermarks, f)
+            os.replace(tmp_path, self.path)
+
+
+def fetch_unreleased_changes(
+    github_api: GithubAPI,
+    store: WatermarkStore,
+    previous_tag_name: Optional[str] = None,
+    branch: str = "master",
+    use_graphql: bool = False,
+    ancestry: bool = False,
+) -> List[PullRequest]:
+    """ Get the PRs merged since the previous tag on a branch, in PR number
+    order, like :func:`changelog.fetch_changes` without a current tag.
+
+    The head of the branch and the PRs found are stored as a watermark. As
+    long as the previous tag hasn't changed and the branch hasn't been force
+    pushed past the watermark, later calls only look for PRs merged after it
+    and add them to the stored ones. """
+    if use_graphql:
+        previous_tag, head = github_api.resolve_range(
+            previous_tag_name, branch=branch
+        )
+    else:
+        previous_tag, head = resolve_range_rest(
+            github_api, previous_tag_name, branch=branch
+        )
+
+    key = store.key(github_api, branch)
+    watermark = store.get(key)
+    stale = watermark is None or watermark.base_sha != previous_tag.commit.sha
+    if stale or watermark.ancestry != ancestry:
+        prs = _all_prs(github_api, previous_tag.commit, head, ancestry)
+    elif watermark.head_sha == head.sha:
+        return list(watermark.prs)
+    elif _rewritten(github_api, watermark, head):
+        # PRs found before may no longer be on the branch
+        prs = _all_prs(github_api, previous_tag.commit, head, ancestry)
+    else:
+        new_prs = _prs_since(github_api, previous_tag, watermark, head, ancestry)
+        prs = _merge(watermark.prs, new_prs)
+
+    store.set(
+        key,
+        Watermark(
+            base_tag=previous_tag.name,
+            base_sha=previous_tag.commit.sha,
+            head_sha=head.sha,
+            head_datetime=head.datetime,
+            ancestry=ancestry,
+            prs=tuple(prs),
+        ),
+    )
+    return prs
+
+
+def _rewritten(github_api: GithubAPI, watermark: Watermark, head: Commit) -> bool:
+    """ Whether the branch was force pushed since the watermark """
+    try:
+        return not github_api.is_ancestor(watermark.head_sha, head.sha)
+    except GitHubError:
+        # GitHub no longer has the old head at all
+        return True
+
+
+def _all_prs(
+    github_api: GithubAPI, first_commit: Commit, last_commit: Commit, ancestry: bool
+) -> List[PullRequest]:
+    if ancestry:
+        commits = github_api.get_commits_between(first_commit, last_commit)
+        return github_api.get_prs_for_commits(commits)
+    return github_api.get_prs_merged_between_commits(first_commit, last_commit)
+
+
+def _prs_since(
+    github_api: GithubAPI,
+    previous_tag: Tag,
+    watermark: Watermark,
+    head: Commit,
+    ancestry: bool,
+) -> Iterable[PullRequest]:
+    if ancestry:
+        watermark_commit = Commit(
+            sha=watermark.head_sha,
+            datetime=watermark.head_datetime,
+            message="",
+            author="",
+        )
+        commits = github_api.get_commits_between(watermark_commit, head)
+        return github_api.get_prs_for_commits(commits)
+
+    # PRs are picked by their creation date, so one created before the
+    # watermark may have been merged since. Look for anything merged after
+    # the watermark that was created in the whole range.
+    from_date = previous_tag.commit.datetime.isoformat(timespec="seconds")
+    to_date = head.datetime.isoformat(timespec="seconds")
+    return github_api.search_pull_requests_between(
+        f"repo:{github_api.owner}/{github_api.repo} is:pr is:merged "
+        f"created:{from_date}..{to_date}",
+        watermark.head_datetime,
+        head.datetime,
+        date_field="merged",
+    )
+
+
+def _merge(
+    prs: Iterable[PullRequest], new_prs: Iterable[PullRequest]
+) -> List[PullRequest]:
+    merged = {pr.number: pr for pr in prs}
+    merged.update((pr.number, pr) for pr in new_prs)
+    return sorted(merged.values(), key=attrgetter("number"))
+
+
+def _pr_to_json(pr: PullRequest) -> Dict[str, Any]:
+    return {
+        "number": pr.number,
+        "title": pr.title,
+        "author": pr.author,
+        "merged_at": pr.merged_at.isoformat() if pr.merged_at else None,
+        "merge_commit_sha": pr.merge_commit_sha,
+        "base_ref_name": pr.base_ref_name,
+        "labels": list(pr.labels),
+    }
+
+
+def _pr_from_json(pr_json: Dict[str, Any]) -> PullRequest:
+    merged_at = pr_json.get("merged_at")
+    return PullRequest(
+        number=pr_json["number"],
+        title=pr_json["title"],
+        author=pr_json["author"],
+        merged_at=parse_datetime_string(merged_at) if merged_at else None,
+        merge_commit_sha=pr_json.get("merge_commit_sha"),
+        base_ref_name=pr_json.get("base_ref_name"),
+        labels=tuple(pr_json.get("labels", ())),
+    )
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+A backend that reads tags, branches and merged PRs from a local clone rather
+than from the GitHub API.
+"""
+import re
+import subprocess
+from operator import attrgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from changelog import (
+    Commit,
+    GitHubError,
+    GithubAPI,
+    PullRequest,
+    Tag,
+    parse_datetime_string,
+    resolve_range_rest,
+)
+
+# Fields are NUL separated, and with ``git log -z`` so are commits. Git
+# refuses NULs in names, emails and commit messages, so every commit is
+# always the next COMMIT_FIELDS fields.
+COMMIT_FORMAT = "%H%x00%aI%x00%an%x00%ae%x00%B"
+COMMIT_FIELDS = 5
+
+MERGE_SUBJECT = re.compile(
+    r"^Merge pull request #(?P<number>\d+) from (?P<head_owner>[^/\s]+)/"
+)
+SQUASH_SUBJECT = re.compile(r"^(?P<title>.*) \(#(?P<number>\d+)\)$")
+NOREPLY_EMAIL = re.compile(r"^(?:\d+\+)?(?P<login>[^@]+)@users\.noreply\.github\.com$")
+
+
+class GitError(GitHubError):
+    pass
+
+
+class LocalGitBackend:
+    """ Answers the same questions as :class:`GithubAPI` from a clone.
+
+    PRs are identified from the commit messages on the first parent history,
+    either ``Merge pull request #123 from ...`` merge commits or squash
+    merges ending in ``(#123)``. When a title or author can't be read from
+    the commit, they are looked up through ``github_api`` if one is given. """
+
+    def __init__(
+        self,
+        path: str = ".",
+        github_api: Optional[GithubAPI] = None,
+        owner: Optional[str] = None,
+    ):
+        self.path = path
+        self.github_api = github_api
+        if owner is None and github_api is not None:
+            owner = github_api.owner
+        self.owner = owner
+
+    def _git(self, *args: str) -> str:
+        try:
+            result = subprocess.run(
+                ["git", "-C", self.path, *args],
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            stderr = getattr(e, "stderr", "") or ""
+            raise GitError(f"git {' '.join(args)} failed: {stderr.strip() or e}")
+        return result.stdout
+
+    def _log(self, *args: str) -> Iterator[Tuple[Commit, Optional[str]]]:
+        """ Yield each commit along with its author's GitHub login, if their
+        email address gives it away """
+        output = self._git("log", "-z", f"--format={COMMIT_FORMAT}", *args)
+        # Each commit is followed by a NUL, including the last
+        fields = output.split("\x00")[:-1]
+        for start in range(0, len(fields), COMMIT_FIELDS):
+            yield _parse_commit(fields[start:start + COMMIT_FIELDS])
+
+    def _commit(self, rev: str) -> Commit:
+        commit, _ = next(self._log("-1", rev))
+        return commit
+
+    def _resolve(self, *revs: str) -> Optional[str]:
+        for rev in revs:
+            try:
+                return self._git("rev-parse", "--verify", "-q", rev).strip()
+            except GitError:
+                continue
+        return None
+
+    def get_tag(self, name: str) -> Tag:
+        """ Get the commit for a given git tag """
+        sha = self._resolve(f"refs/tags/{name}^{{commit}}")
+        if sha is None:
+            raise GitError(f"Tag {name} not found in {self.path}.")
+        return Tag(name, self._commit(sha))
+
+    def get_last_commit(self, branch: str = "master") -> Commit:
+        """ Get the last commit on a branch, falling back to the remote's copy
+        of it as CI checkouts often don't have a local branch """
+        sha = self._resolve(
+            f"refs/heads/{branch}^{{commit}}",
+            f"refs/remotes/origin/{branch}^{{commit}}",
+        )
+        if sha is None:
+            raise GitError(f"Branch {branch} not found in {self.path}.")
+        return self._commit(sha)
+
+    def get_latest_tag(self) -> Tag:
+        """ Get the most recently created tag """
+        name = self._git(
+            "for-each-ref",
+            "--sort=-creatordate",
+            "--count=1",
+            "--format=%(refname:short)",
+            "refs/tags",
+        ).strip()
+        if not name:
+            raise GitError(f"No tags found in {self.path}.")
+        return self.get_tag(name)
+
+    def resolve_range(
+        self,
+        previous_tag_name: Optional[str] = None,
+        current_tag_name: Optional[str] = None,
+        branch: str = "master",
+    ) -> Tuple[Tag, Commit]:
+        """ Get the previous tag and the current tag's commit (or the branch
+        head), for parity with :meth:`GithubAPI.resolve_range` """
+        return resolve_range_rest(self, previous_tag_name, current_tag_name, branch)
+
+    def get_commits_between(
+        self, first_commit: Commit, last_commit: Commit
+    ) -> Iterator[Commit]:
+        """ Get the commits reachable from the last commit but not the first,
+        oldest first """
+        for commit, _ in self._log(
+            "--reverse", f"{first_commit.sha}..{last_commit.sha}"
+        ):
+            yield commit
+
+    def get_prs_merged_between_commits(
+        self, first_commit: Commit, last_commit: Commit
+    ) -> List[PullRequest]:
+        """ Get the PRs merged between two commits, in PR number order """
+        commits = self._log("--first-parent", f"{first_commit.sha}..{last_commit.sha}")
+        prs: Dict[int, PullRequest] = {}
+        for commit, login in commits:
+            pr = pull_request_from_commit(commit, login, self.owner)
+            if pr is not None:
+                prs.setdefault(pr.number, pr)
+
+        missing = [pr.number for pr in prs.values() if not pr.title or not pr.author]
+        if missing and self.github_api is not None:
+            prs.update(self.github_api.get_pull_requests(missing))
+        return sorted(prs.values(), key=attrgetter("number"))
+
+    def iter_prs_merged_between_commits(
+        self, first_commit: Commit, last_commit: Commit
+    ) -> Iterator[PullRequest]:
+        """ For parity with :meth:`GithubAPI.iter_prs_merged_between_commits`,
+        though the whole log is read before the first PR is known """
+        return iter(self.get_prs_merged_between_commits(first_commit, last_commit))
+
+    def get_prs_for_commits(self, commits: Iterable[Commit]) -> List[PullRequest]:
+        """ Get the PRs merged by a set of commits, using GitHub to map each
+        commit to its PR """
+        if self.github_api is None:
+            raise GitError("Mapping commits to PRs needs access to GitHub.")
+        return self.github_api.get_prs_for_commits(commits)
+
+
+def pull_request_from_commit(
+    commit: Commit, login: Optional[str] = None, repo_owner: Optional[str] = None
+) -> Optional[PullRequest]:
+    """ Identify the PR a merge or squash commit landed, leaving the title or
+    author empty when the commit doesn't record them """
+    subject, _, body = commit.message.partition("\n")
+    match = MERGE_SUBJECT.match(subject)
+    if match:
+        # The merge commit is authored by whoever pressed the button. The
+        # branch owner in the subject is the PR author when it came from a
+        # fork, but branches in the repo itself don't tell us the author.
+        head_owner = match["head_owner"]
+        from_fork = (
+            repo_owner is not None and head_owner.lower() != repo_owner.lower()
+        )
+        title = next((line for line in body.splitlines() if line.strip()), "")
+        return PullRequest(
+            number=int(match["number"]),
+            title=title.strip(),
+            author=head_owner if from_fork else "",
+        )
+
+    match = SQUASH_SUBJECT.match(subject)
+    if match:
+        # Squash merges are authored by the PR author, but we only know their
+        # login if they commit with their noreply address
+        return PullRequest(
+            number=int(match["number"]), title=match["title"], author=login or ""
+        )
+    return None
+
+
+def _parse_commit(fields: List[str]) -> Tuple[Commit, Optional[str]]:
+    sha, date, name, email, message = fields
+    match = NOREPLY_EMAIL.match(email)
+    login = match["login"] if match else None
+    commit = Commit(
+        sha=sha,
+        datetime=parse_datetime_string(date),
+        message=message.rstrip("\n"),
+        author=login or name,
+    )
+    return commit, login
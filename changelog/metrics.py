@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus-style counters, gauges and histograms of the requests made to
+GitHub, for processes that keep making them for days.
+"""
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from changelog.tracing import RequestSpan
+
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric:
+    """ A family of time series sharing a name, one per set of label values.
+    ``labels`` picks the series to update, as in ``prometheus_client``. """
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], "Metric"] = {}
+
+    def labels(self, **labels: str) -> "Metric":
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._child()
+            return child
+
+    def _child(self) -> "Metric":
+        return type(self)(self.name, self.documentation)
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        """ The name, labels and value of every sample, for exposition """
+        with self._lock:
+            children = list(self._children.items())
+        if not self.labelnames:
+            yield from self._own_samples()
+        for key, child in children:
+            labels = dict(zip(self.labelnames, key))
+            for name, sample_labels, value in child._own_samples():
+                yield name, {**labels, **sample_labels}, value
+
+    def _own_samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def _own_samples(self):
+        yield self.name, {}, self._value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+
+    def _own_samples(self):
+        yield self.name, {}, self._value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+
+    def _child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets[:-1])
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    def _own_samples(self):
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            yield f"{self.name}_bucket", {"le": _format_value(bound)}, cumulative
+        yield f"{self.name}_sum", {}, total
+        yield f"{self.name}_count", {}, cumulative
+
+
+class MetricsRegistry:
+    """ Creates metrics and renders them in the Prometheus text format.
+
+    Anything with the same ``counter``, ``gauge`` and ``histogram`` methods
+    can be used in its place, such as :class:`PrometheusClientRegistry`. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            # Asking for a metric twice gets the same one
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"{metric.name} is already a {existing.type}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class PrometheusClientRegistry:
+    """ Creates the metrics with ``prometheus_client``, registering them
+    with ``registry`` or its default registry """
+
+    def __init__(self, registry=None):
+        import prometheus_client
+
+        self._prometheus_client = prometheus_client
+        self.registry = registry or prometheus_client.REGISTRY
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        return self._prometheus_client.Counter(
+            name, documentation, labelnames, registry=self.registry
+        )
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        return self._prometheus_client.Gauge(
+            name, documentation, labelnames, registry=self.registry
+        )
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        return self._prometheus_client.Histogram(
+            name, documentation, labelnames, registry=self.registry, buckets=buckets
+        )
+
+    def render(self) -> str:
+        return self._prometheus_client.generate_latest(self.registry).decode("utf-8")
+
+
+class GithubMetrics:
+    """ A request hook for :class:`~changelog.GithubAPI` counting requests,
+    retries, cache hits and GraphQL cost per endpoint, timing them and
+    keeping track of the rate limit budget left """
+
+    def __init__(self, registry=None):
+        self.registry = registry if registry is not None else MetricsRegistry()
+        self.requests = self.registry.counter(
+            "github_requests_total",
+            "Requests made to the GitHub API",
+            ["endpoint", "method", "status"],
+        )
+        self.duration = self.registry.histogram(
+            "github_request_duration_seconds",
+            "How long GitHub API requests took",
+            ["endpoint"],
+        )
+        self.retries = self.registry.counter(
+            "github_request_retries_total",
+            "GitHub API requests that were retries of an earlier attempt",
+            ["endpoint"],
+        )
+        self.cache = self.registry.counter(
+            "github_cache_requests_total",
+            "Requests that went through the response cache, by whether it had them",
+            ["endpoint", "result"],
+        )
+        self.graphql_cost = self.registry.counter(
+            "github_graphql_cost_total",
+            "Rate limit points spent on GraphQL queries",
+            ["endpoint"],
+        )
+        self.rate_limit_remaining = self.registry.gauge(
+            "github_rate_limit_remaining",
+            "Requests or points left in the current rate limit window",
+            ["resource"],
+        )
+        self.rate_limit_reset = self.registry.gauge(
+            "github_rate_limit_reset_timestamp_seconds",
+            "When the current rate limit window ends",
+            ["resource"],
+        )
+
+    def __call__(self, span: RequestSpan) -> None:
+        if span.cache is not None:
+            self.cache.labels(endpoint=span.endpoint, result=span.cache).inc()
+        # Answered from the cache without a request
+        if span.status is None and span.error is None:
+            return
+
+        status = str(span.status) if span.status is not None else "error"
+        self.requests.labels(
+            endpoint=span.endpoint, method=span.method, status=status
+        ).inc()
+        self.duration.labels(endpoint=span.endpoint).observe(span.duration)
+        if span.attempt:
+            self.retries.labels(endpoint=span.endpoint).inc()
+        if span.graphql_cost is not None:
+            self.graphql_cost.labels(endpoint=span.endpoint).inc(span.graphql_cost)
+
+        resource = span.rate_limit.get("X-RateLimit-Resource")
+        if resource is not None and "X-RateLimit-Remaining" in span.rate_limit:
+            remaining = float(span.rate_limit["X-RateLimit-Remaining"])
+            self.rate_limit_remaining.labels(resource=resource).set(remaining)
+            if "X-RateLimit-Reset" in span.rate_limit:
+                reset = float(span.rate_limit["X-RateLimit-Reset"])
+                self.rate_limit_reset.labels(resource=resource).set(reset)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """ Answers ``GET /metrics`` with the server's ``registry`` """
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0].rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        data = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def serve_metrics(
+    registry, address: Tuple[str, int] = ("", 9100)
+) -> ThreadingHTTPServer:
+    """ Serve ``/metrics`` from a background thread, returning the server so
+    that it can be shut down """
+    server = ThreadingHTTPServer(address, MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs: List[str] = [f'{name}="{_escape(value, True)}"' for name, value in labels.items()]
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(text: str, quotes: bool = False) -> str:
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quotes else text
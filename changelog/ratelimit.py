@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Client side accounting of GitHub's rate limits, so that requests are spread
+out over the rate limit window instead of failing once the budget is spent.
+"""
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, Mapping, Optional
+
+CORE = "core"
+GRAPHQL = "graphql"
+
+# Start pacing requests once less than this fraction of the budget is left
+DEFAULT_PACE_BELOW = 0.2
+# Seconds GitHub asks to wait after a secondary rate limit without a
+# Retry-After header
+SECONDARY_RATE_LIMIT_WAIT = 60.0
+
+
+@dataclass(frozen=True)
+class RateLimitBudget:
+    limit: Optional[int] = None
+    remaining: Optional[int] = None
+    # Epoch seconds at which the budget is refilled
+    reset: Optional[float] = None
+    # Epoch seconds before which no request should be made at all
+    blocked_until: float = 0.0
+    # Points the last GraphQL query cost, used to estimate the next one
+    last_cost: int = 1
+
+
+class RateLimiter:
+    """ Tracks the REST (``core``) and GraphQL budgets separately from the
+    ``X-RateLimit-*`` and ``Retry-After`` headers of every response.
+
+    :meth:`delay` is called before each request. While the budget is healthy
+    no delay is needed. Once less than ``pace_below`` of it is left, requests
+    are spaced evenly over the time until the reset. Once it is spent,
+    requests wait until the reset, and once GitHub has asked us to back off
+    they wait for as long as it asked, or at least a minute after a secondary
+    rate limit. Callers give up rather than wait longer than ``max_wait``
+    seconds.
+
+    The remaining budget is read from GitHub on every response, so jobs in
+    other processes sharing the same token are accounted for. A limiter can
+    be shared between threads and between :class:`GithubAPI` instances. """
+
+    def __init__(
+        self,
+        pace_below: float = DEFAULT_PACE_BELOW,
+        max_wait: Optional[float] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.pace_below = pace_below
+        self.max_wait = max_wait
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._budgets: Dict[str, RateLimitBudget] = {}
+        self._next_slot: Dict[str, float] = {}
+
+    def budget(self, resource: str = CORE) -> RateLimitBudget:
+        """ The last known budget for a resource """
+        with self._lock:
+            return self._budgets.get(resource, RateLimitBudget())
+
+    def remaining(self, resource: str = CORE) -> Optional[int]:
+        return self.budget(resource).remaining
+
+    def delay(self, resource: str = CORE) -> float:
+        """ Reserve a slot for a request and return how long to wait for it """
+        with self._lock:
+            now = self._clock()
+            budget = self._budgets.get(resource, RateLimitBudget())
+            start = max(now, budget.blocked_until)
+
+            if budget.reset is not None and budget.reset <= start:
+                # The window has rolled over since we last heard from GitHub
+                budget = replace(budget, remaining=None, reset=None)
+            elif budget.remaining is not None and budget.reset is not None:
+                cost = budget.last_cost if resource == GRAPHQL else 1
+                if budget.remaining < cost:
+                    start = budget.reset
+                elif budget.limit and budget.remaining < self.pace_below * budget.limit:
+                    interval = (budget.reset - start) / (budget.remaining / cost)
+                    start = max(start, self._next_slot.get(resource, start))
+                    self._next_slot[resource] = start + interval
+                # Count the request now so concurrent callers pace themselves
+                # before GitHub's answer arrives
+                budget = replace(budget, remaining=budget.remaining - cost)
+
+            self._budgets[resource] = budget
+            return max(0.0, start - now)
+
+    def update(
+        self,
+        resource: str,
+        headers: Mapping[str, str],
+        status_code: int = 200,
+        content: bytes = b"",
+    ) -> None:
+        """ Record the budget GitHub reported in a response's headers, and
+        whether its status and ``content`` say we were rate limited """
+        resource = headers.get("X-RateLimit-Resource", resource)
+        with self._lock:
+            now = self._clock()
+            budget = self._budgets.get(resource, RateLimitBudget())
+            if "X-RateLimit-Remaining" in headers:
+                budget = replace(
+                    budget,
+                    limit=_int_header(headers, "X-RateLimit-Limit", budget.limit),
+                    remaining=_int_header(headers, "X-RateLimit-Remaining"),
+                    reset=_int_header(headers, "X-RateLimit-Reset", budget.reset),
+                )
+
+            retry_after = _int_header(headers, "Retry-After")
+            if retry_after is not None:
+                blocked_until = now + retry_after
+            elif is_rate_limited(headers, status_code, content):
+                if headers.get("X-RateLimit-Remaining") == "0" and budget.reset is not None:
+                    blocked_until = budget.reset
+                else:
+                    blocked_until = now + SECONDARY_RATE_LIMIT_WAIT
+            else:
+                blocked_until = budget.blocked_until
+            self._budgets[resource] = replace(budget, blocked_until=blocked_until)
+
+    def record_cost(self, resource: str, cost: int, remaining: Optional[int] = None):
+        """ Record the cost of a GraphQL query from its ``rateLimit`` field """
+        with self._lock:
+            budget = self._budgets.get(resource, RateLimitBudget())
+            if remaining is None:
+                remaining = budget.remaining
+            self._budgets[resource] = replace(
+                budget, last_cost=max(cost, 1), remaining=remaining
+            )
+
+
+def is_rate_limited(
+    headers: Mapping[str, str], status_code: int, content: bytes = b""
+) -> bool:
+    """ Whether a response was refused because of a primary or secondary
+    rate limit. Secondary limits aren't always sent with a Retry-After, and
+    are otherwise only told apart from other 403s by their message. """
+    if status_code == 429:
+        return True
+    if status_code != 403:
+        return False
+    if headers.get("X-RateLimit-Remaining") == "0" or "Retry-After" in headers:
+        return True
+    return b"secondary rate limit" in content.lower()
+
+
+def _int_header(headers: Mapping[str, str], name: str, default=None):
+    try:
+        return int(headers[name])
+    except (KeyError, ValueError):
+        return default
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Renderers that turn a stream of releases and PRs into changelog lines, so
+that every requested format can be written from one pass over the PRs.
+"""
+import html
+import json
+from datetime import datetime
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    TextIO,
+    Tuple,
+    Type,
+)
+
+if TYPE_CHECKING:
+    from changelog import PullRequest
+
+# A release's tag name and date, or None for a changelog that isn't split
+# into releases, along with its PRs
+Section = Tuple[Optional[str], Optional[datetime], Iterable["PullRequest"]]
+
+# Where PRs without any of the categorized labels go
+OTHER_CATEGORY = "Other changes"
+
+
+class Renderer:
+    """ Produces the lines for one format. For each section ``begin_section``
+    is called, then ``pull_request`` for each of its PRs as they arrive and
+    then ``end_section``. Anything that has to wait for the end of a section
+    should be kept as small as possible.
+
+    When PRs are grouped by label, ``category`` is called before each
+    group. Otherwise it is called once per section with ``None``.
+
+    ``release`` names the release a changelog that isn't split into
+    releases is for, if it is known. """
+
+    name = ""
+
+    def __init__(
+        self, base_url: str, owner: str, repo: str, release: Optional[str] = None
+    ):
+        self.base_url = base_url
+        self.owner = owner
+        self.repo = repo
+        self.release = release
+        # How many sections have been rendered, and how many categories in
+        # the current section
+        self.sections = 0
+        self.categories = 0
+
+    def pr_url(self, pr: "PullRequest") -> str:
+        return f"{self.base_url}/{self.owner}/{self.repo}/pull/{pr.number}"
+
+    def begin(self) -> List[str]:
+        return []
+
+    def begin_section(self, name: Optional[str], date: Optional[datetime]) -> List[str]:
+        return []
+
+    def category(self, name: Optional[str]) -> List[str]:
+        return []
+
+    def pull_request(self, pr: "PullRequest") -> List[str]:
+        raise NotImplementedError
+
+    def end_section(self) -> List[str]:
+        return []
+
+    def end(self) -> List[str]:
+        return []
+
+
+class RstRenderer(Renderer):
+    """ reStructuredText bullets, with the link targets after each section """
+
+    name = "rst"
+
+    def __init__(
+        self, base_url: str, owner: str, repo: str, release: Optional[str] = None
+    ):
+        super().__init__(base_url, owner, repo, release)
+        self._numbers: List[int] = []
+
+    def begin_section(self, name: Optional[str], date: Optional[datetime]) -> List[str]:
+        if name is None:
+            return []
+        lines = [name, "-" * len(name), ""]
+        return [""] + lines if self.sections else lines
+
+    def category(self, name: Optional[str]) -> List[str]:
+        if name is None:
+            return []
+        lines = [name, "~" * len(name), ""]
+        return [""] + lines if self.categories else lines
+
+    def pull_request(self, pr: "PullRequest") -> List[str]:
+        # Only the number is kept, the PR itself can be thrown away
+        self._numbers.append(pr.number)
+        return [f"- `#{pr.number}`_ {pr.title} (@{pr.author})"]
+
+    def end_section(self) -> List[str]:
+        base_url = f"{self.base_url}/{self.owner}/{self.repo}/pull"
+        lines = [f".. _#{number}: {base_url}/{number}" for number in self._numbers]
+        self._numbers = []
+        return lines
+
+
+class MarkdownRenderer(Renderer):
+    name = "markdown"
+
+    def begin_section(self, name: Optional[str], date: Optional[datetime]) -> List[str]:
+        if name is None:
+            return []
+        lines = [f"## {name}", ""]
+        return [""] + lines if self.sections else lines
+
+    def category(self, name: Optional[str]) -> List[str]:
+        if name is None:
+            return []
+        lines = [f"### {name}", ""]
+        return [""] + lines if self.categories else lines
+
+    def pull_request(self, pr: "PullRequest") -> List[str]:
+        return [f"- [#{pr.number}]({self.pr_url(pr)}) {pr.title} (@{pr.author})"]
+
+
+class KeepAChangelogRenderer(Renderer):
+    """ Markdown laid out as described at https://keepachangelog.com """
+
+    name = "keepachangelog"
+
+    def begin(self) -> List[str]:
+        return [
+            "# Changelog",
+            "",
+            "All notable changes to this project will be documented in this file.",
+        ]
+
+    def begin_section(self, name: Optional[str], date: Optional[datetime]) -> List[str]:
+        heading = f"## [{name or self.release or 'Unreleased'}]"
+        if date is not None:
+            heading += f" - {date.date().isoformat()}"
+        return ["", heading]
+
+    def category(self, name: Optional[str]) -> List[str]:
+        return ["", f"### {name or 'Changed'}", ""]
+
+    def pull_request(self, pr: "PullRequest") -> List[str]:
+        return [f"- {pr.title} ([#{pr.number}]({self.pr_url(pr)})) by @{pr.author}"]
+
+
+class HtmlRenderer(Renderer):
+    """ An HTML fragment with a list per section """
+
+    name = "html"
+
+    def begin_section(self, name: Optional[str], date: Optional[datetime]) -> List[str]:
+        return [f"<h2>{html.escape(name)}</h2>"] if name is not None else []
+
+    def category(self, name: Optional[str]) -> List[str]:
+        lines = ["</ul>"] if self.categories else []
+        if name is not None:
+            lines.append(f"<h3>{html.escape(name)}</h3>")
+        return lines + ["<ul>"]
+
+    def pull_request(self, pr: "PullRequest") -> List[str]:
+        url = html.escape(self.pr_url(pr), quote=True)
+        return [
+            f'<li><a href="{url}">#{pr.number}</a> {html.escape(pr.title)} '
+            f"(@{html.escape(pr.author)})</li>"
+        ]
+
+    def end_section(self) -> List[str]:
+        return ["</ul>"] if self.categories else []
+
+
+class JsonLinesRenderer(Renderer):
+    """ One JSON object per PR """
+
+    name = "jsonl"
+
+    def begin_section(self, name: Optional[str], date: Optional[datetime]) -> List[str]:
+        self._release = name or self.release
+        return []
+
+    def category(self, name: Optional[str]) -> List[str]:
+        self._category = name
+        return []
+
+    def pull_request(self, pr: "PullRequest") -> List[str]:
+        pr_json = {
+            "number": pr.number,
+            "title": pr.title,
+            "author": pr.author,
+            "url": self.pr_url(pr),
+            "merged_at": pr.merged_at.isoformat() if pr.merged_at else None,
+            "release": self._release,
+            "category": self._category,
+        }
+        return [json.dumps(pr_json)]
+
+
+RENDERERS: Dict[str, Type[Renderer]] = {
+    renderer.name: renderer
+    for renderer in (
+        RstRenderer,
+        MarkdownRenderer,
+        KeepAChangelogRenderer,
+        HtmlRenderer,
+        JsonLinesRenderer,
+    )
+}
+
+
+def categorize(
+    prs: Iterable["PullRequest"], categories: Mapping[str, str]
+) -> List[Tuple[str, List["PullRequest"]]]:
+    """ Group PRs in one pass using a map of label names to categories. A PR
+    with several of the labels goes in the category listed first, and those
+    with none of them go last in :data:`OTHER_CATEGORY`. Empty categories
+    are left out. """
+    order = list(dict.fromkeys(categories.values())) + [OTHER_CATEGORY]
+    labels = list(categories)
+    rank = {label: i for i, label in enumerate(labels)}
+    buckets: Dict[str, List["PullRequest"]] = {category: [] for category in order}
+    for pr in prs:
+        ranked = [rank[label] for label in pr.labels if label in rank]
+        if ranked:
+            buckets[categories[labels[min(ranked)]]].append(pr)
+        else:
+            buckets[OTHER_CATEGORY].append(pr)
+    return [(category, buckets[category]) for category in order if buckets[category]]
+
+
+def iter_rendered(
+    renderer: Renderer,
+    sections: Iterable[Section],
+    categories: Optional[Mapping[str, str]] = None,
+) -> Iterator[str]:
+    """ Render sections in one format, yielding each line as it is ready """
+    for step in _steps(sections, categories):
+        yield from step(renderer)
+
+
+def write_rendered(
+    outputs: List[Tuple[Renderer, TextIO]],
+    sections: Iterable[Section],
+    single_line: bool = False,
+    categories: Optional[Mapping[str, str]] = None,
+) -> None:
+    """ Render sections in several formats at once, going over the PRs once
+    and writing each line to its format's file as soon as it is ready """
+    separator = "\\n" if single_line else "\n"
+    started = [False] * len(outputs)
+    for step in _steps(sections, categories):
+        for i, (renderer, f) in enumerate(outputs):
+            lines = step(renderer)
+            for line in lines:
+                f.write(f"{separator}{line}" if started[i] else line)
+                started[i] = True
+            if lines:
+                f.flush()
+    for _, f in outputs:
+        f.write("\n")
+
+
+def _steps(
+    sections: Iterable[Section], categories: Optional[Mapping[str, str]]
+) -> Iterator[Callable[[Renderer], List[str]]]:
+    """ Turn sections into a sequence of calls to make on every renderer """
+    yield lambda renderer: renderer.begin()
+    for name, date, prs in sections:
+        yield lambda renderer: _begin_section(renderer, name, date)
+        # Grouping has to wait for all of a section's PRs
+        groups = categorize(prs, categories) if categories else [(None, prs)]
+        for category, category_prs in groups:
+            yield lambda renderer: _category(renderer, category)
+            for pr in category_prs:
+                yield lambda renderer: renderer.pull_request(pr)
+        yield _end_section
+    yield lambda renderer: renderer.end()
+
+
+def _begin_section(
+    renderer: Renderer, name: Optional[str], date: Optional[datetime]
+) -> List[str]:
+    renderer.categories = 0
+    return renderer.begin_section(name, date)
+
+
+def _category(renderer: Renderer, name: Optional[str]) -> List[str]:
+    lines = renderer.category(name)
+    renderer.categories += 1
+    return lines
+
+
+def _end_section(renderer: Renderer) -> List[str]:
+    lines = renderer.end_section()
+    renderer.sections += 1
+    return lines
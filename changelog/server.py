@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+A long running HTTP service that answers changelog requests from memory
+where it can, for dashboards that would otherwise run the CLI per page view.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from changelog import (
+    PUBLIC_GITHUB_API_URL,
+    PUBLIC_GITHUB_URL,
+    Authorization,
+    DeadlineExceeded,
+    GitHubConfig,
+    GitHubError,
+    GithubAPI,
+    SessionConfig,
+    add_github_arguments,
+    create_session,
+    fetch_changes,
+    format_changes,
+)
+from changelog.cache import ResponseCache
+from changelog.metrics import CONTENT_TYPE, GithubMetrics, MetricsRegistry
+from changelog.ratelimit import RateLimiter
+from changelog.store import MetadataStore
+from changelog.webhook import WebhookReceiver
+
+DEFAULT_MAX_ENTRIES = 1024
+# Changelogs up to a branch head go stale as PRs are merged
+DEFAULT_HEAD_TTL = 60.0
+# How many changelogs are precomputed at once
+BACKGROUND_WORKERS = 2
+
+# owner, repo, previous tag, current tag
+ChangelogKey = Tuple[str, str, Optional[str], Optional[str]]
+# owner, repo, whether the changelogs end at a branch head
+GenerationKey = Tuple[str, str, bool]
+
+
+@dataclass(frozen=True)
+class CachedChangelog:
+    changelog: str
+    # time.monotonic() value after which the changelog is regenerated
+    expires: Optional[float] = None
+
+
+class ChangelogService:
+    """ Generates changelogs with one shared connection pool, response cache,
+    metadata store and rate limiter, keeping the last ``max_entries`` of them
+    in memory.
+
+    Changelogs between two tags are kept until their repo is invalidated,
+    those up to the branch head for ``head_ttl`` seconds. Concurrent requests
+    for the same changelog share one generation.
+
+    Given a ``metrics`` registry, the requests made to GitHub and the
+    changelogs served are counted and timed in it. """
+
+    def __init__(
+        self,
+        github_base_url: str = PUBLIC_GITHUB_URL,
+        github_api_url: str = PUBLIC_GITHUB_API_URL,
+        github_token: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+        metadata_db: Optional[str] = None,
+        graphql: bool = False,
+        timeout: Optional[float] = None,
+        ancestry: bool = False,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        head_ttl: float = DEFAULT_HEAD_TTL,
+        clock: Callable[[], float] = time.monotonic,
+        metrics: Optional[MetricsRegistry] = None,
+        transport: str = "requests",
+    ):
+        self.github_base_url = github_base_url
+        self.github_config = GitHubConfig(
+            api_url=github_api_url,
+            authorization=Authorization(github_token),
+            session_config=SessionConfig(transport=transport),
+        )
+        self.graphql = graphql
+        self.timeout = timeout
+        self.ancestry = ancestry
+        self.max_entries = max_entries
+        self.head_ttl = head_ttl
+        self._clock = clock
+        self._session = create_session(self.github_config)
+        self._cache = ResponseCache(cache_dir) if cache_dir is not None else None
+        self.store = MetadataStore(metadata_db) if metadata_db is not None else None
+        self._rate_limiter = RateLimiter()
+        self._background = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS)
+
+        self.metrics = metrics
+        self._request_hooks = ()
+        if metrics is not None:
+            self._request_hooks = (GithubMetrics(metrics),)
+            self._served = metrics.counter(
+                "changelog_requests_total",
+                "Changelogs asked for, by whether they were in memory",
+                ["cache"],
+            )
+            self._generation_time = metrics.histogram(
+                "changelog_generation_seconds", "How long generating a changelog took"
+            )
+
+        self._lock = threading.Lock()
+        self._changelogs: "OrderedDict[ChangelogKey, CachedChangelog]" = OrderedDict()
+        self._in_flight: Dict[ChangelogKey, Future] = {}
+        # Bumped on every invalidation of the changelogs they cover, so that
+        # one that was being generated at the time isn't cached
+        self._generations: Dict[GenerationKey, int] = {}
+
+    def close(self) -> None:
+        self._background.shutdown(wait=False)
+        self._session.close()
+        if self.store is not None:
+            self.store.close()
+
+    def github_api(self, owner: str, repo: str) -> GithubAPI:
+        """ A client for a repo that shares the service's connections, caches
+        and rate limits """
+        deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+        return GithubAPI(
+            self.github_config,
+            owner,
+            repo,
+            session=self._session,
+            cache=self._cache,
+            rate_limiter=self._rate_limiter,
+            deadline=deadline,
+            store=self.store,
+            request_hooks=self._request_hooks,
+        )
+
+    def changelog(
+        self,
+        owner: str,
+        repo: str,
+        previous_tag: Optional[str] = None,
+        current_tag: Optional[str] = None,
+    ) -> Tuple[str, bool]:
+        """ Get a changelog and whether it was already in memory """
+        changelog, cached = self._changelog(owner, repo, previous_tag, current_tag)
+        if self.metrics is not None:
+            self._served.labels(cache="hit" if cached else "miss").inc()
+        return changelog, cached
+
+    def _changelog(
+        self,
+        owner: str,
+        repo: str,
+        previous_tag: Optional[str],
+        current_tag: Optional[str],
+    ) -> Tuple[str, bool]:
+        key = (owner, repo, previous_tag, current_tag)
+        with self._lock:
+            cached = self._changelogs.get(key)
+            if cached is not None and (
+                cached.expires is None or cached.expires > self._clock()
+            ):
+                self._changelogs.move_to_end(key)
+                return cached.changelog, True
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                leader = False
+            else:
+                leader = True
+                future = self._in_flight[key] = Future()
+                generation_key = (owner, repo, current_tag is None)
+                generation = self._generations.get(generation_key, 0)
+
+        if not leader:
+            return future.result(), True
+
+        start = time.monotonic()
+        try:
+            changelog = self._generate(*key)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(changelog)
+            if self.metrics is not None:
+                self._generation_time.observe(time.monotonic() - start)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+        with self._lock:
+            if self._generations.get(generation_key, 0) == generation:
+                expires = None
+                if current_tag is None:
+                    expires = self._clock() + self.head_ttl
+                self._changelogs[key] = CachedChangelog(changelog, expires)
+                self._changelogs.move_to_end(key)
+                while len(self._changelogs) > self.max_entries:
+                    self._changelogs.popitem(last=False)
+        return changelog, False
+
+    def precompute_release(self, owner: str, repo: str, tag_name: str) -> Future:
+        """ Generate the changelog from the tag before a new tag to it in the
+        background, so that it is in memory by the time it is asked for """
+
+        def run():
+            try:
+                tags = [tag.name for tag in self.github_api(owner, repo).get_tags()]
+                if tag_name not in tags or tags.index(tag_name) == 0:
+                    return
+                previous_tag = tags[tags.index(tag_name) - 1]
+                self.changelog(owner, repo, previous_tag, tag_name)
+            except GitHubError as e:
+                print(f"Precomputing {owner}/{repo} {tag_name} failed: {e}", file=sys.stderr)
+
+        return self._background.submit(run)
+
+    def invalidate(self, owner: str, repo: str, unreleased_only: bool = False) -> int:
+        """ Forget the changelogs for a repo, or only those that end at a
+        branch head, returning how many there were """
+        with self._lock:
+            for unreleased in (True,) if unreleased_only else (True, False):
+                generation_key = (owner, repo, unreleased)
+                self._generations[generation_key] = (
+                    self._generations.get(generation_key, 0) + 1
+                )
+            keys = [
+                key
+                for key in self._changelogs
+                if key[:2] == (owner, repo) and not (unreleased_only and key[3])
+            ]
+            for key in keys:
+                del self._changelogs[key]
+        return len(keys)
+
+    def _generate(
+        self,
+        owner: str,
+        repo: str,
+        previous_tag: Optional[str],
+        current_tag: Optional[str],
+    ) -> str:
+        prs = fetch_changes(
+            self.github_api(owner, repo),
+            previous_tag_name=previous_tag,
+            current_tag_name=current_tag,
+            use_graphql=self.graphql,
+            ancestry=self.ancestry,
+        )
+        return "\n".join(format_changes(self.github_base_url, owner, repo, prs))
+
+
+class ChangelogRequestHandler(BaseHTTPRequestHandler):
+    """ ``GET /OWNER/REPO[/PREVIOUS[...CURRENT]]`` returns a changelog,
+    ``DELETE /OWNER/REPO`` forgets the ones in memory for a repo and GitHub
+    webhooks are delivered to ``POST /webhook``. ``GET /metrics`` returns
+    the service's metrics, if it keeps any. """
+
+    protocol_version = "HTTP/1.1"
+    server: "ChangelogServer"
+
+    def do_GET(self):
+        metrics = self.server.service.metrics
+        if metrics is not None and urlsplit(self.path).path == "/metrics":
+            body = metrics.render().rstrip("\n")
+            return self._send(HTTPStatus.OK, body, content_type=CONTENT_TYPE)
+
+        route = parse_path(self.path)
+        if route is None:
+            return self._send(
+                HTTPStatus.NOT_FOUND, "Expected /OWNER/REPO/PREVIOUS...CURRENT"
+            )
+
+        try:
+            changelog, cached = self.server.service.changelog(*route)
+        except DeadlineExceeded as e:
+            return self._send(HTTPStatus.GATEWAY_TIMEOUT, str(e))
+        except GitHubError as e:
+            return self._send(HTTPStatus.BAD_GATEWAY, str(e))
+        self._send(HTTPStatus.OK, changelog, {"X-Cache": "HIT" if cached else "MISS"})
+
+    def do_DELETE(self):
+        route = parse_path(self.path)
+        if route is None or route[2:] != (None, None):
+            return self._send(HTTPStatus.NOT_FOUND, "Expected /OWNER/REPO")
+
+        count = self.server.service.invalidate(*route[:2])
+        self._send(HTTPStatus.OK, f"Forgot {count} changelogs")
+
+    def do_POST(self):
+        if urlsplit(self.path).path.rstrip("/") != "/webhook":
+            return self._send(HTTPStatus.NOT_FOUND, "Webhooks go to /webhook")
+
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        webhook = self.server.webhook
+        if not webhook.verify(body, self.headers.get("X-Hub-Signature-256")):
+            return self._send(HTTPStatus.UNAUTHORIZED, "Bad signature")
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return self._send(HTTPStatus.BAD_REQUEST, "Expected a JSON payload")
+
+        event = self.headers.get("X-GitHub-Event", "")
+        self._send(HTTPStatus.OK, webhook.handle(event, payload))
+
+    def _send(
+        self,
+        status: int,
+        body: str,
+        headers: Optional[Dict[str, str]] = None,
+        content_type: str = "text/plain; charset=utf-8",
+    ) -> None:
+        data = (body + "\n").encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ChangelogServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        service: ChangelogService,
+        webhook_secret: Optional[str] = None,
+    ):
+        super().__init__(address, ChangelogRequestHandler)
+        self.service = service
+        self.webhook = WebhookReceiver(service, webhook_secret)
+
+
+def parse_path(path: str) -> Optional[ChangelogKey]:
+    """ Split ``/OWNER/REPO[/PREVIOUS[...CURRENT]]`` into its parts """
+    parts = [unquote(part) for part in urlsplit(path).path.strip("/").split("/", 2)]
+    if len(parts) < 2 or not all(parts):
+        return None
+
+    owner, repo = parts[:2]
+    previous_tag = current_tag = None
+    if len(parts) == 3:
+        previous_tag, _, current_tag = parts[2].partition("...")
+        if not previous_tag:
+            return None
+    return owner, repo, previous_tag, current_tag or None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve CHANGELOGs over HTTP at /OWNER/REPO/PREVIOUS...CURRENT"
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--max-entries",
+        type=int,
+        default=DEFAULT_MAX_ENTRIES,
+        help="how many changelogs to keep in memory",
+    )
+    parser.add_argument(
+        "--head-ttl",
+        type=float,
+        default=DEFAULT_HEAD_TTL,
+        help="how many seconds to keep changelogs that end at a branch head",
+    )
+    parser.add_argument(
+        "--webhook-secret",
+        type=str,
+        default=os.environ.get("GITHUB_WEBHOOK_SECRET"),
+        help="secret GitHub signs the webhooks delivered to /webhook with, "
+        "without which merged PRs they announce aren't stored",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="serve Prometheus metrics of the requests made to GitHub and the "
+        "changelogs served at /metrics",
+    )
+    add_github_arguments(parser)
+    args = parser.parse_args()
+
+    service = ChangelogService(
+        github_base_url=args.github_base_url,
+        github_api_url=args.github_api_url,
+        github_token=args.github_token,
+        cache_dir=args.cache_dir,
+        metadata_db=args.metadata_db,
+        graphql=args.graphql,
+        timeout=args.timeout,
+        ancestry=args.ancestry,
+        max_entries=args.max_entries,
+        head_ttl=args.head_ttl,
+        metrics=MetricsRegistry() if args.metrics else None,
+        transport=args.transport,
+    )
+    server = ChangelogServer((args.host, args.port), service, args.webhook_secret)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+A local SQLite index of the tags, commits and pull requests already fetched
+from GitHub, so that repeated questions about a repo need no requests.
+"""
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from changelog import Commit, PullRequest, Tag, _batch_bounds, parse_datetime_string
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tags (
+    owner TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    name TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    PRIMARY KEY (owner, repo, name)
+);
+CREATE TABLE IF NOT EXISTS commits (
+    owner TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    datetime TEXT NOT NULL,
+    message TEXT NOT NULL,
+    author TEXT NOT NULL,
+    -- Whether the PRs merged by this commit are known to be in the index
+    prs_indexed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (owner, repo, sha)
+);
+CREATE TABLE IF NOT EXISTS pull_requests (
+    owner TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    merged_at TEXT,
+    merge_commit_sha TEXT,
+    base_ref_name TEXT,
+    -- A JSON list of label names
+    labels TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (owner, repo, number)
+);
+CREATE INDEX IF NOT EXISTS pull_requests_by_merge_commit
+    ON pull_requests (owner, repo, merge_commit_sha);
+"""
+
+PULL_REQUEST_COLUMNS = (
+    "number, title, author, merged_at, merge_commit_sha, base_ref_name, labels"
+)
+
+# SQLite limits the number of parameters in one statement
+QUERY_BATCH_SIZE = 500
+
+
+class MetadataStore:
+    """ Persists :class:`~changelog.Tag`, :class:`~changelog.Commit` and
+    :class:`~changelog.PullRequest` objects per repo: tags by name, commits
+    by sha and PRs by number and by merge commit.
+
+    Only things that don't change once GitHub has reported them are stored:
+    commits, merged PRs and tags, which are treated as fixed once pushed
+    unless they are deleted with :meth:`delete_tag`. A store can be shared
+    between threads, and between processes through the same database file. """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            # Let readers in other processes carry on while one writes
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def get_tag(self, owner: str, repo: str, name: str) -> Optional[Tag]:
+        """ The tag with the given name, if it and its commit are stored """
+        row = self._fetchone(
+            "SELECT c.sha, c.datetime, c.message, c.author FROM tags t "
+            "JOIN commits c ON c.owner = t.owner AND c.repo = t.repo AND c.sha = t.sha "
+            "WHERE t.owner = ? AND t.repo = ? AND t.name = ?",
+            (owner, repo, name),
+        )
+        if row is None:
+            return None
+        return Tag(name, _commit_from_row(row))
+
+    def put_tag(self, owner: str, repo: str, tag: Tag) -> None:
+        with self._lock, self._connection:
+            self._insert_commits(owner, repo, [tag.commit])
+            self._connection.execute(
+                "INSERT OR REPLACE INTO tags (owner, repo, name, sha) "
+                "VALUES (?, ?, ?, ?)",
+                (owner, repo, tag.name, tag.commit.sha),
+            )
+
+    def delete_tag(self, owner: str, repo: str, name: str) -> None:
+        """ Forget a tag that was moved or deleted """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM tags WHERE owner = ? AND repo = ? AND name = ?",
+                (owner, repo, name),
+            )
+
+    def get_commit(self, owner: str, repo: str, sha: str) -> Optional[Commit]:
+        row = self._fetchone(
+            "SELECT sha, datetime, message, author FROM commits "
+            "WHERE owner = ? AND repo = ? AND sha = ?",
+            (owner, repo, sha),
+        )
+        return _commit_from_row(row) if row is not None else None
+
+    def put_commits(self, owner: str, repo: str, commits: Iterable[Commit]) -> None:
+        with self._lock, self._connection:
+            self._insert_commits(owner, repo, commits)
+
+    def get_pull_requests(
+        self, owner: str, repo: str, numbers: Iterable[int]
+    ) -> Dict[int, PullRequest]:
+        """ The stored PRs out of the given numbers, by number """
+        rows = self._fetchall_in(
+            f"SELECT {PULL_REQUEST_COLUMNS} FROM pull_requests "
+            "WHERE owner = ? AND repo = ? AND number IN (%s)",
+            (owner, repo),
+            list(numbers),
+        )
+        prs = map(_pull_request_from_row, rows)
+        return {pr.number: pr for pr in prs}
+
+    def put_pull_requests(
+        self, owner: str, repo: str, prs: Iterable[PullRequest]
+    ) -> None:
+        """ Store the merged PRs out of the given ones """
+        with self._lock, self._connection:
+            self._insert_pull_requests(owner, repo, prs)
+
+    def get_prs_for_commits(
+        self, owner: str, repo: str, shas: Iterable[str]
+    ) -> Tuple[List[PullRequest], List[str]]:
+        """ The stored PRs merged by the given commits, and the shas of the
+        commits whose PRs haven't been indexed yet """
+        shas = list(shas)
+        indexed = set(
+            sha
+            for sha, in self._fetchall_in(
+                "SELECT sha FROM commits WHERE owner = ? AND repo = ? "
+                "AND prs_indexed AND sha IN (%s)",
+                (owner, repo),
+                shas,
+            )
+        )
+        rows = self._fetchall_in(
+            f"SELECT {PULL_REQUEST_COLUMNS} FROM pull_requests "
+            "WHERE owner = ? AND repo = ? AND merge_commit_sha IN (%s)",
+            (owner, repo),
+            list(indexed),
+        )
+        prs = [_pull_request_from_row(row) for row in rows]
+        return prs, [sha for sha in shas if sha not in indexed]
+
+    def put_prs_for_commits(
+        self,
+        owner: str,
+        repo: str,
+        commits: Iterable[Commit],
+        prs: Iterable[PullRequest],
+    ) -> None:
+        """ Store the PRs merged by a set of commits, and remember that the
+        commits' PRs are all known """
+        commits = list(commits)
+        with self._lock, self._connection:
+            self._insert_pull_requests(owner, repo, prs)
+            self._insert_commits(owner, repo, commits)
+            self._connection.executemany(
+                "UPDATE commits SET prs_indexed = 1 "
+                "WHERE owner = ? AND repo = ? AND sha = ?",
+                [(owner, repo, commit.sha) for commit in commits],
+            )
+
+    def _insert_commits(
+        self, owner: str, repo: str, commits: Iterable[Commit]
+    ) -> None:
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO commits (owner, repo, sha, datetime, message, author) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    owner,
+                    repo,
+                    commit.sha,
+                    commit.datetime.isoformat(),
+                    commit.message,
+                    commit.author,
+                )
+                for commit in commits
+            ],
+        )
+
+    def _insert_pull_requests(
+        self, owner: str, repo: str, prs: Iterable[PullRequest]
+    ) -> None:
+        self._connection.executemany(
+            f"INSERT OR REPLACE INTO pull_requests (owner, repo, {PULL_REQUEST_COLUMNS}) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    owner,
+                    repo,
+                    pr.number,
+                    pr.title,
+                    pr.author,
+                    pr.merged_at.isoformat(),
+                    pr.merge_commit_sha,
+                    pr.base_ref_name,
+                    json.dumps(pr.labels),
+                )
+                for pr in prs
+                # Open PRs can still be edited
+                if pr.merged_at is not None
+            ],
+        )
+
+    def _fetchone(self, sql: str, params: Tuple) -> Optional[Tuple]:
+        with self._lock:
+            return self._connection.execute(sql, params).fetchone()
+
+    def _fetchall_in(self, sql: str, params: Tuple, values: List) -> List[Tuple]:
+        """ Run a query with an ``IN (%s)`` clause over every value, in
+        batches small enough for SQLite """
+        rows = []
+        with self._lock:
+            for start, end in _batch_bounds(len(values), QUERY_BATCH_SIZE):
+                batch = values[start:end]
+                placeholders = ", ".join("?" * len(batch))
+                rows.extend(
+                    self._connection.execute(sql % placeholders, params + tuple(batch))
+                )
+        return rows
+
+
+def _commit_from_row(row: Tuple) -> Commit:
+    sha, date, message, author = row
+    return Commit(
+        sha=sha, datetime=parse_datetime_string(date), message=message, author=author
+    )
+
+
+def _pull_request_from_row(row: Tuple) -> PullRequest:
+    number, title, author, merged_at, merge_commit_sha, base_ref_name, labels = row
+    return PullRequest(
+        number=number,
+        title=title,
+        author=author,
+        merged_at=parse_datetime_string(merged_at) if merged_at else None,
+        merge_commit_sha=merge_commit_sha,
+        base_ref_name=base_ref_name,
+        labels=tuple(json.loads(labels)),
+    )
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+A stand-in for the parts of the GitHub REST and GraphQL APIs that changelog
+uses, serving a synthetic repository from memory.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+LABELS = ("enhancement", "bug", "dependencies", None)
+# GitHub search never returns more than this many results for one query
+SEARCH_RESULT_LIMIT = 1000
+# The compare endpoint's largest page
+COMPARE_PAGE_LIMIT = 250
+# Every this many commits are by an email that isn't linked to an account
+UNLINKED_AUTHOR_EVERY = 5
+DATE_QUALIFIER = re.compile(r"\b(created|merged):(\S+)\.\.(\S+)")
+
+
+def _iso(date: datetime) -> str:
+    return date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class SyntheticRepo:
+    """ A repo with an initial commit followed by one merge commit per PR,
+    a minute apart. ``v0`` tags the initial commit and ``v1`` the last one,
+    with a ``v0.N`` tag every ``release_size`` PRs in between. """
+
+    def __init__(
+        self,
+        pr_count: int,
+        owner: str = "bench",
+        name: str = "repo",
+        release_size: Optional[int] = None,
+    ):
+        self.owner = owner
+        self.name = name
+        self.pr_count = pr_count
+        # Commit i merges PR i, commit 0 is the initial commit
+        self.dates = [EPOCH + timedelta(minutes=i) for i in range(pr_count + 1)]
+        self.tags: Dict[str, int] = {"v0": 0, "v1": pr_count}
+        # The commit the branch points at, which can be moved back as if
+        # it had been force pushed
+        self.head = pr_count
+        if release_size:
+            for i in range(release_size, pr_count, release_size):
+                self.tags[f"v0.{i // release_size}"] = i
+
+    @staticmethod
+    def sha(index: int) -> str:
+        return f"{index + 1:040x}"
+
+    @staticmethod
+    def index(sha: str) -> int:
+        return int(sha, 16) - 1
+
+    def message(self, index: int) -> str:
+        if index == 0:
+            return "Initial commit"
+        return f"Merge pull request #{index} from dev/branch-{index}\n\nChange {index}"
+
+    @staticmethod
+    def user(index: int) -> Optional[Dict[str, Any]]:
+        """ The account commit ``index`` is linked to, if any """
+        if index % UNLINKED_AUTHOR_EVERY == UNLINKED_AUTHOR_EVERY - 1:
+            return None
+        return {"login": "dev"}
+
+    def rest_commit(self, index: int) -> Dict[str, Any]:
+        return {
+            "sha": self.sha(index),
+            "commit": {
+                "author": {"name": "Dev", "date": _iso(self.dates[index])},
+                "message": self.message(index),
+            },
+            "author": self.user(index),
+        }
+
+    def graphql_commit(self, index: int) -> Dict[str, Any]:
+        return {
+            "oid": self.sha(index),
+            "authoredDate": _iso(self.dates[index]),
+            "message": self.message(index),
+            "author": {"name": "Dev", "user": self.user(index)},
+        }
+
+    def pull_request(self, number: int) -> Dict[str, Any]:
+        label = LABELS[number % len(LABELS)]
+        return {
+            "title": f"Change {number}",
+            "number": number,
+            "author": {"login": f"dev{number % 7}"},
+            "mergedAt": _iso(self.dates[number]),
+            "mergeCommit": {"oid": self.sha(number)},
+            "baseRefName": "master",
+            "labels": {"nodes": [{"name": label}] if label else []},
+        }
+
+    def ref(self, qualified_name: str) -> Optional[Dict[str, Any]]:
+        if qualified_name.startswith("refs/tags/"):
+            name = qualified_name[len("refs/tags/"):]
+            if name not in self.tags:
+                return None
+            index = self.tags[name]
+        else:
+            name = qualified_name.rsplit("/", 1)[-1]
+            index = self.head
+        return {"name": name, "target": self.graphql_commit(index)}
+
+    def search(self, query: str) -> List[int]:
+        """ The numbers of the PRs matching a search's date qualifiers """
+        low, high = 1, self.pr_count
+        for _, start, end in DATE_QUALIFIER.findall(query):
+            start_date, end_date = _parse_date(start), _parse_date(end)
+            low = max(low, bisect_left(self.dates, start_date))
+            high = min(high, bisect_right(self.dates, end_date) - 1)
+        return list(range(low, high + 1))
+
+
+@dataclass
+class FakeGitHubConfig:
+    # Seconds added to every response
+    latency: float = 0.0
+    # The largest page of search results that is served
+    search_page_size: int = 100
+    # Requests allowed per rate limit window for each of REST and GraphQL
+    rate_limit: int = 1_000_000
+    rate_limit_window: float = 3600.0
+
+
+@dataclass
+class FakeGitHubStats:
+    requests: int = 0
+    bytes_received: int = 0
+    bytes_sent: int = 0
+    # Conditional GETs answered with 304 Not Modified
+    not_modified: int = 0
+    by_endpoint: Dict[str, int] = field(default_factory=dict)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "not_modified": self.not_modified,
+            "by_endpoint": dict(self.by_endpoint),
+        }
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # The body is written after the headers, which would otherwise wait on
+    # the client's delayed ACK of them
+    disable_nagle_algorithm = True
+    server: "FakeGitHub"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/_stats":
+            return self._send(200, self.server.stats.to_json(), count=False)
+
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        repo = self.server.repo
+        prefix = f"/repos/{repo.owner}/{repo.name}/"
+        if not url.path.startswith(prefix):
+            return self._send(404, {"message": "Not Found"}, "other")
+        path = unquote(url.path[len(prefix):])
+
+        if path.startswith("git/refs/tags/"):
+            name = path[len("git/refs/tags/"):]
+            if name not in repo.tags:
+                return self._send(404, {"message": "Not Found"}, "git/refs")
+            sha = repo.sha(repo.tags[name])
+            return self._send(
+                200,
+                {
+                    "ref": f"refs/tags/{name}",
+                    "object": {"type": "commit", "sha": sha, "url": ""},
+                },
+                "git/refs",
+            )
+        if path == "tags":
+            tags = sorted(repo.tags.items(), key=lambda tag: tag[1], reverse=True)
+            return self._send(
+                200,
+                [{"name": name, "commit": {"sha": repo.sha(i)}} for name, i in tags],
+                "tags",
+            )
+        if path == "commits":
+            newest = range(repo.head, max(repo.head - 30, -1), -1)
+            return self._send(200, [repo.rest_commit(i) for i in newest], "commits")
+        if path.startswith("commits/"):
+            index = repo.index(path[len("commits/"):])
+            return self._send(200, repo.rest_commit(index), "commits")
+        if path.startswith("compare/"):
+            first, _, last = path[len("compare/"):].partition("...")
+            first_index, last_index = repo.index(first), repo.index(last)
+            indices = range(first_index + 1, last_index + 1)
+            page_size = min(int(params.get("per_page", 30)), COMPARE_PAGE_LIMIT)
+            page = int(params.get("page", 1))
+            page_indices = indices[(page - 1) * page_size:page * page_size]
+            return self._send(
+                200,
+                {
+                    "status": _compare_status(first_index, last_index),
+                    "total_commits": len(indices),
+                    "commits": [repo.rest_commit(i) for i in page_indices],
+                },
+                "compare",
+            )
+        self._send(404, {"message": "Not Found"}, "other")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if url.path == "/_reset":
+            self.server.reset()
+            return self._send(200, {}, count=False)
+        if url.path != "/graphql":
+            return self._send(404, {"message": "Not Found"}, "other")
+
+        self.server.count_received(len(body))
+        payload = json.loads(body)
+        query = payload["query"]
+        variables = payload.get("variables") or {}
+        repo = self.server.repo
+
+        if "search(" in query:
+            return self._send(200, self._search(query, variables), "graphql/search")
+        if "associatedPullRequests" in query:
+            repository = {}
+            for alias, sha in re.findall(r'(\w+): object\(oid: "(\w+)"\)', query):
+                index = repo.index(sha)
+                nodes = [repo.pull_request(index)] if 0 < index <= repo.pr_count else []
+                repository[alias] = {"associatedPullRequests": {"nodes": nodes}}
+            return self._send(200, _data(repository), "graphql/associated")
+        if "pullRequest(number" in query:
+            repository = {}
+            for alias, number in re.findall(r"(\w+): pullRequest\(number: (\d+)\)", query):
+                number = int(number)
+                found = 0 < number <= repo.pr_count
+                repository[alias] = repo.pull_request(number) if found else None
+            return self._send(200, _data(repository), "graphql/pull_requests")
+        if "previous: ref(" in query:
+            repository = {"current": repo.ref(variables["current"])}
+            if variables["latest"]:
+                latest = max(repo.tags, key=repo.tags.get)
+                repository["latest"] = {"nodes": [repo.ref(f"refs/tags/{latest}")]}
+            else:
+                repository["previous"] = repo.ref(variables["previous"])
+            return self._send(200, _data(repository), "graphql/range")
+        if "refs(refPrefix" in query:
+            names = sorted(repo.tags)
+            start = int(variables.get("after") or 0)
+            end = start + variables["first"]
+            refs = {
+                "pageInfo": {"endCursor": str(end), "hasNextPage": end < len(names)},
+                "nodes": [repo.ref(f"refs/tags/{name}") for name in names[start:end]],
+            }
+            return self._send(200, _data({"refs": refs}), "graphql/tags")
+        self._send(200, {"errors": [{"message": "Unsupported query"}]}, "graphql/other")
+
+    def _search(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        repo = self.server.repo
+        numbers = repo.search(variables["query"])
+        first = min(variables["first"], self.server.config.search_page_size)
+        start = int(variables.get("after") or 0)
+        end = min(start + first, len(numbers), SEARCH_RESULT_LIMIT)
+        search = {
+            "issueCount": len(numbers),
+            "pageInfo": {
+                "endCursor": str(end),
+                "hasNextPage": end < min(len(numbers), SEARCH_RESULT_LIMIT),
+            },
+            "nodes": [repo.pull_request(number) for number in numbers[start:end]],
+        }
+        return {"data": {"rateLimit": {"cost": 1}, "search": search}}
+
+    def _send(
+        self,
+        status: int,
+        body: Any,
+        endpoint: Optional[str] = None,
+        count: bool = True,
+    ) -> None:
+        headers = {}
+        if count:
+            resource = "graphql" if endpoint.startswith("graphql") else "core"
+            remaining, reset = self.server.take_request(resource, endpoint)
+            headers = {
+                "X-RateLimit-Limit": str(self.server.config.rate_limit),
+                "X-RateLimit-Remaining": str(max(remaining, 0)),
+                "X-RateLimit-Reset": str(int(reset)),
+                "X-RateLimit-Resource": resource,
+            }
+            if remaining < 0:
+                status, body = 403, {"message": "API rate limit exceeded"}
+            elif isinstance(body, dict) and "rateLimit" in body.get("data", {}):
+                body["data"]["rateLimit"]["remaining"] = remaining
+            if self.server.config.latency:
+                time.sleep(self.server.config.latency)
+
+        data = json.dumps(body).encode("utf-8")
+        if self.command == "GET" and status == 200:
+            etag = f'"{hashlib.sha1(data).hexdigest()}"'
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                status, data = 304, b""
+                self.server.count_not_modified()
+        if count:
+            self.server.count_sent(len(data))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeGitHub(ThreadingHTTPServer):
+    """ Serves ``repo`` at ``http://HOST:PORT``, which is given to changelog
+    as the API URL. ``GET /_stats`` and ``POST /_reset`` read and clear the
+    request counts. """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        repo: SyntheticRepo,
+        config: FakeGitHubConfig = FakeGitHubConfig(),
+        address: Tuple[str, int] = ("127.0.0.1", 0),
+    ):
+        super().__init__(address, FakeGitHubHandler)
+        self.repo = repo
+        self.config = config
+        self._lock = threading.Lock()
+        self.reset()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stats = FakeGitHubStats()
+            self._windows: Dict[str, Tuple[float, int]] = {}
+
+    def take_request(self, resource: str, endpoint: str) -> Tuple[int, float]:
+        """ Count a request, returning what's left of the rate limit window
+        and when it resets """
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.by_endpoint[endpoint] = self.stats.by_endpoint.get(endpoint, 0) + 1
+            now = time.time()
+            reset, used = self._windows.get(resource, (0.0, 0))
+            if now >= reset:
+                reset, used = now + self.config.rate_limit_window, 0
+            used += 1
+            self._windows[resource] = (reset, used)
+            return self.config.rate_limit - used, reset
+
+    def count_received(self, size: int) -> None:
+        with self._lock:
+            self.stats.bytes_received += size
+
+    def count_sent(self, size: int) -> None:
+        with self._lock:
+            self.stats.bytes_sent += size
+
+    def count_not_modified(self) -> None:
+        with self._lock:
+            self.stats.not_modified += 1
+
+
+def _compare_status(first_index: int, last_index: int) -> str:
+    # Commits are in a line, so neither is ever diverged
+    if first_index == last_index:
+        return "identical"
+    return "ahead" if first_index < last_index else "behind"
+
+
+def _parse_date(date: str) -> datetime:
+    parsed = datetime.fromisoformat(date.replace("Z", "+00:00"))
+    # Search takes dates without a timezone to be in UTC
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _data(repository: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "data": {
+            "rateLimit": {"cost": 1},
+            "repository": repository,
+        }
+    }
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from changelog import Authorization, GitHubConfig, GithubAPI
+from changelog.cache import CachedResponse, ResponseCache
+from changelog.tests.test_server import start_fake_github
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        cache = ResponseCache(self.directory)
+        response = CachedResponse(body={"sha": "abc"}, etag='"1"', last_modified="Mon")
+        cache.set("https://api/commits", {"per_page": "30"}, response)
+
+        self.assertEqual(cache.get("https://api/commits", {"per_page": "30"}), response)
+        self.assertIsNone(cache.get("https://api/commits"))
+        self.assertEqual(
+            response.validators,
+            {"If-None-Match": '"1"', "If-Modified-Since": "Mon"},
+        )
+
+    def test_least_recently_used_entries_are_evicted(self):
+        entry_size = self.entry_size()
+        cache = ResponseCache(self.directory, max_size=3 * entry_size)
+        for i, url in enumerate("abc"):
+            cache.set(url, None, CachedResponse(body=i))
+            # Modification times are only as fine as the filesystem's clock
+            os.utime(cache._path(url, None), (i, i))
+
+        # Reading an entry makes it the most recently used
+        self.assertEqual(cache.get("a").body, 0)
+        cache.set("d", None, CachedResponse(body=3))
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual([cache.get(url).body for url in "acd"], [0, 2, 3])
+
+    def test_clear(self):
+        cache = ResponseCache(self.directory)
+        cache.set("a", None, CachedResponse(body=0))
+        cache.clear()
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def entry_size(self):
+        directory = tempfile.mkdtemp()
+        try:
+            cache = ResponseCache(directory)
+            cache.set("a", None, CachedResponse(body=0))
+            return os.path.getsize(cache._path("a", None))
+        finally:
+            shutil.rmtree(directory)
+
+
+class ApiQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fake = start_fake_github()
+        self.directory = tempfile.mkdtemp()
+        config = GitHubConfig(api_url=self.fake.url, authorization=Authorization(None))
+        self.github_api = GithubAPI(
+            config, "bench", "repo", cache=ResponseCache(self.directory)
+        )
+
+    def tearDown(self):
+        self.github_api.close()
+        self.fake.shutdown()
+        self.fake.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_immutable_response_is_served_without_a_request(self):
+        url = self.github_api.get_commit_url(self.fake.repo.sha(3))
+        first = self.github_api.api_query(url, immutable=True)
+        self.assertEqual(self.fake.stats.requests, 1)
+
+        self.assertEqual(self.github_api.api_query(url, immutable=True), first)
+        self.assertEqual(self.fake.stats.requests, 1)
+
+    def test_unchanged_response_is_revalidated(self):
+        url = self.github_api.tags_url
+        first = self.github_api.api_query(url)
+
+        self.assertEqual(self.github_api.api_query(url), first)
+        self.assertEqual(self.fake.stats.requests, 2)
+        self.assertEqual(self.fake.stats.not_modified, 1)
+
+    def test_changed_response_replaces_the_cached_one(self):
+        url = self.github_api.tags_url
+        self.github_api.api_query(url)
+        self.fake.repo.tags["v0.3"] = 25
+
+        tags = self.github_api.api_query(url)
+        self.assertIn("v0.3", [tag["name"] for tag in tags])
+        self.assertEqual(self.fake.stats.not_modified, 0)
+        self.assertEqual(self.github_api.api_query(url), tags)
+        self.assertEqual(self.fake.stats.not_modified, 1)
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from changelog import Authorization, GitHubConfig, GithubAPI
+from changelog.incremental import WatermarkStore, fetch_unreleased_changes
+from changelog.tests.test_server import start_fake_github
+
+
+class FetchUnreleasedChangesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fake = start_fake_github()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "state.json")
+        config = GitHubConfig(api_url=self.fake.url, authorization=Authorization(None))
+        self.github_api = GithubAPI(config, "bench", "repo")
+
+    def tearDown(self):
+        self.github_api.close()
+        self.fake.shutdown()
+        self.fake.server_close()
+        shutil.rmtree(self.directory)
+
+    def fetch(self, ancestry=False):
+        prs = fetch_unreleased_changes(
+            self.github_api, WatermarkStore(self.path), "v0.2", ancestry=ancestry
+        )
+        return [pr.number for pr in prs]
+
+    @staticmethod
+    def expected(last, ancestry=False):
+        # Searches by date include the PR merged by the tagged commit
+        return list(range(21 if ancestry else 20, last + 1))
+
+    def test_new_prs_are_added_to_the_watermark(self):
+        for ancestry in (False, True):
+            with self.subTest(ancestry=ancestry):
+                self.fake.repo.head = 25
+                self.assertEqual(self.fetch(ancestry), self.expected(25, ancestry))
+                self.fake.repo.head = 30
+                self.assertEqual(self.fetch(ancestry), self.expected(30, ancestry))
+
+    def test_unchanged_head_needs_no_search(self):
+        self.fetch()
+        self.fake.reset()
+        self.assertEqual(self.fetch(), self.expected(30))
+        self.assertNotIn("graphql/search", self.fake.stats.by_endpoint)
+
+    def test_force_push_drops_prs_no_longer_on_the_branch(self):
+        for ancestry in (False, True):
+            with self.subTest(ancestry=ancestry):
+                self.fake.repo.head = 30
+                self.assertEqual(self.fetch(ancestry), self.expected(30, ancestry))
+                self.fake.repo.head = 25
+                self.assertEqual(self.fetch(ancestry), self.expected(25, ancestry))
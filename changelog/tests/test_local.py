@@ -0,0 +1,95 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from changelog.local import LocalGitBackend
+
+
+@unittest.skipUnless(shutil.which("git"), "git isn't installed")
+class LocalGitBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        # Each commit a minute after the last, so they aren't all at once
+        self.minutes = 0
+        self.addCleanup(shutil.rmtree, self.path)
+        self.git("init", "-q")
+        self.git("symbolic-ref", "HEAD", "refs/heads/master")
+        self.commit("Initial commit")
+        self.git("tag", "v1")
+
+        # A PR merged with a merge commit from a fork
+        self.git("checkout", "-q", "-b", "feature")
+        self.commit("Add the thing", name="Contributor", email="contributor@example.com")
+        self.git("checkout", "-q", "master")
+        self.commit(
+            "Merge pull request #1 from contributor/feature\n\nAdd the thing",
+            "--no-ff",
+            "feature",
+            command="merge",
+        )
+        # A squash merge whose body has the separator the log used to be
+        # split on
+        self.commit(
+            "Fix the bug (#2)\n\n* Fix the bug\n* Tidy up \x1e the tests",
+            name="Octo Cat",
+            email="583231+octocat@users.noreply.github.com",
+        )
+        self.commit("Commit straight to master")
+        self.git("tag", "v2")
+        self.backend = LocalGitBackend(self.path, owner="bench")
+
+    def git(self, *args, name="Maintainer", email="maintainer@example.com"):
+        self.minutes += 1
+        date = f"2020-01-01T00:{self.minutes:02}:00+00:00"
+        env = dict(
+            os.environ,
+            GIT_AUTHOR_NAME=name,
+            GIT_AUTHOR_EMAIL=email,
+            GIT_AUTHOR_DATE=date,
+            GIT_COMMITTER_NAME=name,
+            GIT_COMMITTER_EMAIL=email,
+            GIT_COMMITTER_DATE=date,
+            GIT_CONFIG_NOSYSTEM="1",
+        )
+        subprocess.run(
+            ["git", "-C", self.path, *args],
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+
+    def commit(self, message, *args, command="commit", **author):
+        with tempfile.NamedTemporaryFile("w", delete=False) as f:
+            f.write(message)
+        self.addCleanup(os.remove, f.name)
+        if command == "commit":
+            args = ("--allow-empty",) + args
+        self.git(command, "-q", "-F", f.name, *args, **author)
+
+    def test_merged_prs_between_tags(self):
+        v1 = self.backend.get_tag("v1")
+        v2 = self.backend.get_tag("v2")
+        prs = self.backend.get_prs_merged_between_commits(v1.commit, v2.commit)
+
+        self.assertEqual([pr.number for pr in prs], [1, 2])
+        self.assertEqual((prs[0].title, prs[0].author), ("Add the thing", "contributor"))
+        self.assertEqual((prs[1].title, prs[1].author), ("Fix the bug", "octocat"))
+
+    def test_messages_are_read_whole(self):
+        commits = list(self.backend._log("v1..v2"))
+        self.assertEqual(len(commits), 4)
+        squash, login = commits[1]
+        self.assertEqual(
+            squash.message, "Fix the bug (#2)\n\n* Fix the bug\n* Tidy up \x1e the tests"
+        )
+        self.assertEqual((squash.author, login), ("octocat", "octocat"))
+        self.assertEqual(commits[0][0].author, "Maintainer")
+
+    def test_latest_tag(self):
+        self.assertEqual(self.backend.get_latest_tag().name, "v2")
+
+    def test_empty_range(self):
+        v2 = self.backend.get_tag("v2")
+        self.assertEqual(self.backend.get_prs_merged_between_commits(v2.commit, v2.commit), [])
@@ -0,0 +1,76 @@
+import unittest
+
+from changelog.ratelimit import CORE, GRAPHQL, RateLimiter
+
+
+def rate_limit_headers(limit, remaining, reset, resource=CORE):
+    return {
+        "X-RateLimit-Limit": str(limit),
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Reset": str(reset),
+        "X-RateLimit-Resource": resource,
+    }
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.limiter = RateLimiter(pace_below=0.2, clock=lambda: self.now)
+
+    def test_unknown_budget_needs_no_delay(self):
+        self.assertEqual(self.limiter.delay(CORE), 0.0)
+        self.assertIsNone(self.limiter.remaining(CORE))
+
+    def test_healthy_budget_needs_no_delay(self):
+        self.limiter.update(CORE, rate_limit_headers(5000, 4000, 4600))
+        for _ in range(10):
+            self.assertEqual(self.limiter.delay(CORE), 0.0)
+        # Requests are counted before GitHub's answer arrives
+        self.assertEqual(self.limiter.remaining(CORE), 3990)
+
+    def test_low_budget_is_paced_until_the_reset(self):
+        # 100 requests left for the next 1000 seconds
+        self.limiter.update(CORE, rate_limit_headers(5000, 100, 2000))
+        self.assertEqual(self.limiter.delay(CORE), 0.0)
+        self.assertAlmostEqual(self.limiter.delay(CORE), 10.0, delta=0.5)
+        self.assertAlmostEqual(self.limiter.delay(CORE), 20.0, delta=0.5)
+
+        # A request made once its slot has come needs no further wait
+        self.now += 40
+        self.assertEqual(self.limiter.delay(CORE), 0.0)
+
+    def test_spent_budget_waits_for_the_reset(self):
+        self.limiter.update(CORE, rate_limit_headers(5000, 0, 1600))
+        self.assertEqual(self.limiter.delay(CORE), 600.0)
+
+        # Once the window has rolled over the budget is unknown until GitHub
+        # reports the new one
+        self.now = 1600.0
+        self.assertEqual(self.limiter.delay(CORE), 0.0)
+        self.assertIsNone(self.limiter.remaining(CORE))
+
+    def test_graphql_budget_is_spent_by_query_cost(self):
+        self.limiter.update(GRAPHQL, rate_limit_headers(5000, 4000, 4600, GRAPHQL))
+        self.limiter.record_cost(GRAPHQL, 30, remaining=20)
+        self.assertEqual(self.limiter.delay(GRAPHQL), 3600.0)
+        # The REST budget is kept separately
+        self.assertEqual(self.limiter.delay(CORE), 0.0)
+
+    def test_retry_after_blocks_requests(self):
+        self.limiter.update(CORE, rate_limit_headers(5000, 4000, 4600))
+        self.limiter.update(CORE, {"Retry-After": "60"}, status_code=403)
+        self.assertEqual(self.limiter.budget(CORE).blocked_until, 1060.0)
+        self.assertEqual(self.limiter.delay(CORE), 60.0)
+
+        self.now += 60
+        self.assertEqual(self.limiter.delay(CORE), 0.0)
+
+    def test_rate_limited_response_blocks_until_the_reset(self):
+        self.limiter.update(CORE, rate_limit_headers(5000, 0, 1300), status_code=403)
+        self.assertEqual(self.limiter.budget(CORE).blocked_until, 1300.0)
+        self.assertEqual(self.limiter.delay(CORE), 300.0)
+
+    def test_resource_is_read_from_the_headers(self):
+        self.limiter.update(CORE, rate_limit_headers(5000, 0, 1600, GRAPHQL))
+        self.assertIsNone(self.limiter.remaining(CORE))
+        self.assertEqual(self.limiter.remaining(GRAPHQL), 0)
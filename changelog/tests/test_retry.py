@@ -0,0 +1,154 @@
+import json
+import random
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from changelog import (
+    Authorization,
+    DeadlineExceeded,
+    GitHubConfig,
+    GitHubError,
+    GithubAPI,
+    RateLimitError,
+    RetryConfig,
+)
+from changelog.ratelimit import CORE, RateLimiter, SECONDARY_RATE_LIMIT_WAIT, is_rate_limited
+from changelog.tests.test_server import serve_in_background
+
+SECONDARY_RATE_LIMIT = (
+    403,
+    {},
+    {"message": "You have exceeded a secondary rate limit. Please wait a few minutes."},
+)
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """ Answers with the server's scripted responses in turn, repeating the
+    last one once they run out """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        status, headers, body = server.responses[min(server.requests, len(server.responses)) - 1]
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FixedBackoff(RetryConfig):
+    def backoff(self, attempt):
+        return self.backoff_factor
+
+
+class RetryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ScriptedHandler)
+        self.server.daemon_threads = True
+        self.server.requests = 0
+        serve_in_background(self.server)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.apis = []
+
+    def tearDown(self):
+        for github_api in self.apis:
+            github_api.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def github_api(self, backoff=0.0, **kwargs):
+        config = GitHubConfig(
+            api_url=self.url,
+            authorization=Authorization(None),
+            retry_config=FixedBackoff(backoff_factor=backoff),
+        )
+        github_api = GithubAPI(config, "bench", "repo", **kwargs)
+        self.apis.append(github_api)
+        return github_api
+
+    def query(self, github_api):
+        return github_api.api_query(self.url + "/repos/bench/repo/tags")
+
+    def test_server_error_is_retried(self):
+        self.server.responses = [(502, {}, {}), (200, {}, [{"name": "v1"}])]
+        self.assertEqual(self.query(self.github_api()), [{"name": "v1"}])
+        self.assertEqual(self.server.requests, 2)
+
+    def test_retries_run_out(self):
+        self.server.responses = [(502, {}, {})]
+        with self.assertRaises(GitHubError):
+            self.query(self.github_api())
+        self.assertEqual(self.server.requests, RetryConfig.total + 1)
+
+    def test_client_error_is_not_retried(self):
+        self.server.responses = [(404, {}, {"message": "Not Found"})]
+        with self.assertRaises(GitHubError):
+            self.query(self.github_api())
+        self.assertEqual(self.server.requests, 1)
+
+    def test_backoff_that_would_pass_the_deadline_gives_up(self):
+        self.server.responses = [(502, {}, {})]
+        github_api = self.github_api(backoff=5.0, deadline=time.monotonic() + 1)
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            self.query(github_api)
+        self.assertEqual(self.server.requests, 1)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_passed_deadline_makes_no_request(self):
+        self.server.responses = [(200, {}, [])]
+        with self.assertRaises(DeadlineExceeded):
+            self.query(self.github_api(deadline=time.monotonic() - 1))
+        self.assertEqual(self.server.requests, 0)
+
+    def test_secondary_rate_limit_backs_off_for_a_minute(self):
+        self.server.responses = [SECONDARY_RATE_LIMIT]
+        rate_limiter = RateLimiter(max_wait=1)
+        start = time.time()
+        with self.assertRaises(RateLimitError):
+            self.query(self.github_api(rate_limiter=rate_limiter))
+        self.assertEqual(self.server.requests, 1)
+        self.assertGreaterEqual(
+            rate_limiter.budget(CORE).blocked_until, start + SECONDARY_RATE_LIMIT_WAIT
+        )
+
+    def test_retry_after_is_waited_for(self):
+        self.server.responses = [
+            (403, {"Retry-After": "1"}, {"message": "Slow down"}),
+            (200, {}, []),
+        ]
+        start = time.monotonic()
+        self.assertEqual(self.query(self.github_api(rate_limiter=RateLimiter())), [])
+        self.assertGreaterEqual(time.monotonic() - start, 1)
+        self.assertEqual(self.server.requests, 2)
+
+
+class BackoffTestCase(unittest.TestCase):
+    def test_backoff_is_jittered_below_an_exponential_ceiling(self):
+        retry_config = RetryConfig(backoff_factor=0.5, max_backoff=3.0)
+        random.seed(0)
+        for attempt, ceiling in ((1, 1.0), (2, 2.0), (3, 3.0), (10, 3.0)):
+            delays = [retry_config.backoff(attempt) for _ in range(100)]
+            self.assertTrue(all(0 <= delay <= ceiling for delay in delays))
+            self.assertGreater(max(delays), ceiling / 2)
+
+
+class IsRateLimitedTestCase(unittest.TestCase):
+    def test_is_rate_limited(self):
+        self.assertTrue(is_rate_limited({}, 429))
+        self.assertTrue(is_rate_limited({"X-RateLimit-Remaining": "0"}, 403))
+        self.assertTrue(is_rate_limited({"Retry-After": "30"}, 403))
+        body = json.dumps(SECONDARY_RATE_LIMIT[2]).encode("utf-8")
+        self.assertTrue(is_rate_limited({"X-RateLimit-Remaining": "4000"}, 403, body))
+        self.assertFalse(is_rate_limited({}, 403, b'{"message": "Resource not accessible"}'))
+        self.assertFalse(is_rate_limited({}, 502, body))
@@ -0,0 +1,81 @@
+import unittest
+from datetime import timedelta
+
+from changelog import (
+    Authorization,
+    GitHubConfig,
+    GithubAPI,
+    SEARCH_RESULT_LIMIT,
+    plan_search_windows,
+)
+from changelog.tests.fake_github import EPOCH, FakeGitHub, SyntheticRepo
+from changelog.tests.test_server import serve_in_background
+
+QUALIFIERS = "repo:bench/repo is:pr is:merged"
+
+
+class PlanSearchWindowsTestCase(unittest.TestCase):
+    def test_windows_are_sized_from_the_result_count(self):
+        end = EPOCH + timedelta(hours=1)
+        windows = plan_search_windows(EPOCH, end, 3000)
+        # Each window is planned to be three quarters full
+        self.assertEqual(len(windows), 4)
+        self.assertEqual(windows[0], (EPOCH, EPOCH + timedelta(minutes=15)))
+        self.assertEqual(windows[-1][1], end)
+        for (_, previous_end), (start, _) in zip(windows, windows[1:]):
+            self.assertEqual(previous_end, start)
+
+    def test_range_is_always_split(self):
+        self.assertEqual(len(plan_search_windows(EPOCH, EPOCH + timedelta(days=1), 1001)), 2)
+
+    def test_windows_are_at_least_a_second_long(self):
+        end = EPOCH + timedelta(seconds=3)
+        windows = plan_search_windows(EPOCH, end, 100 * SEARCH_RESULT_LIMIT)
+        self.assertEqual(
+            windows,
+            [(EPOCH + timedelta(seconds=i), EPOCH + timedelta(seconds=i + 1)) for i in range(3)],
+        )
+
+
+class SearchPullRequestsBetweenTestCase(unittest.TestCase):
+    """ Searches over GitHub's result cap, against a fake that merges a PR
+    every minute """
+
+    def setUp(self):
+        self.fake = FakeGitHub(SyntheticRepo(3000))
+        serve_in_background(self.fake)
+        config = GitHubConfig(api_url=self.fake.url, authorization=Authorization(None))
+        self.github_api = GithubAPI(config, "bench", "repo")
+
+    def tearDown(self):
+        self.github_api.close()
+        self.fake.shutdown()
+        self.fake.server_close()
+
+    def search(self, start, end, **kwargs):
+        prs = self.github_api.search_pull_requests_between(QUALIFIERS, start, end, **kwargs)
+        return [pr.number for pr in prs]
+
+    def test_pr_on_a_window_boundary_is_returned_once(self):
+        end = EPOCH + timedelta(minutes=1500)
+        windows = plan_search_windows(EPOCH, end, 1500)
+        # Both windows include the second PR 750 was merged in
+        self.assertEqual(windows[0][1], EPOCH + timedelta(minutes=750))
+        self.assertEqual(windows[1][0], windows[0][1])
+
+        self.assertEqual(self.search(EPOCH, end), list(range(1, 1501)))
+
+    def test_every_pr_is_returned_once_past_the_result_cap(self):
+        # The PRs are all in the second half of the range, so the windows
+        # they fall in hold more than the cap and are split again
+        start = EPOCH - timedelta(minutes=3000)
+        end = EPOCH + timedelta(minutes=3000)
+        for max_workers in (1, 4):
+            with self.subTest(max_workers=max_workers):
+                prs = self.search(start, end, max_workers=max_workers)
+                self.assertEqual(prs, list(range(1, 3001)))
+
+    def test_range_under_the_cap_is_a_single_search(self):
+        self.assertEqual(self.search(EPOCH, EPOCH + timedelta(minutes=100)), list(range(1, 101)))
+        # One page holds all of them
+        self.assertEqual(self.fake.stats.by_endpoint, {"graphql/search": 1})
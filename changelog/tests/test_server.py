@@ -0,0 +1,234 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from changelog import GitHubError
+from changelog.server import (
+    ChangelogRequestHandler,
+    ChangelogServer,
+    ChangelogService,
+    parse_path,
+)
+from changelog.tests.fake_github import FakeGitHub, SyntheticRepo
+
+
+def start_fake_github() -> FakeGitHub:
+    """ A fake GitHub serving bench/repo, with v0.1 and v0.2 ten PRs apart """
+    fake = FakeGitHub(SyntheticRepo(30, release_size=10))
+    serve_in_background(fake)
+    return fake
+
+
+def serve_in_background(server) -> None:
+    # Poll often so that shutting down doesn't slow the tests
+    threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    ).start()
+
+
+class ChangelogServiceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fake = start_fake_github()
+        self.now = 0.0
+        self.service = ChangelogService(
+            github_api_url=self.fake.url, head_ttl=60.0, clock=lambda: self.now
+        )
+
+    def tearDown(self):
+        self.service.close()
+        self.fake.shutdown()
+        self.fake.server_close()
+
+    def test_changelog_between_tags(self):
+        changelog, cached = self.service.changelog("bench", "repo", "v0.1", "v0.2")
+        self.assertFalse(cached)
+        self.assertIn("- `#15`_ Change 15 (@dev1)", changelog)
+        self.assertIn(".. _#15: https://github.com/bench/repo/pull/15", changelog)
+        self.assertNotIn("#25", changelog)
+
+    def test_repeated_changelog_is_served_from_memory(self):
+        first, _ = self.service.changelog("bench", "repo", "v0.1", "v0.2")
+        requests = self.fake.stats.requests
+
+        second, cached = self.service.changelog("bench", "repo", "v0.1", "v0.2")
+        self.assertTrue(cached)
+        self.assertEqual(first, second)
+        self.assertEqual(self.fake.stats.requests, requests)
+
+    def test_changelog_to_branch_head_expires(self):
+        self.service.changelog("bench", "repo", "v0.2")
+        self.now += 30
+        self.assertTrue(self.service.changelog("bench", "repo", "v0.2")[1])
+        self.now += 31
+        self.assertFalse(self.service.changelog("bench", "repo", "v0.2")[1])
+
+    def test_changelog_between_tags_does_not_expire(self):
+        self.service.changelog("bench", "repo", "v0.1", "v0.2")
+        self.now += 3600
+        self.assertTrue(self.service.changelog("bench", "repo", "v0.1", "v0.2")[1])
+
+    def test_invalidate(self):
+        self.service.changelog("bench", "repo", "v0.1", "v0.2")
+        self.service.changelog("bench", "repo", "v0.2")
+
+        self.assertEqual(self.service.invalidate("bench", "repo"), 2)
+        self.assertFalse(self.service.changelog("bench", "repo", "v0.1", "v0.2")[1])
+        self.assertFalse(self.service.changelog("bench", "repo", "v0.2")[1])
+
+    def test_invalidate_unreleased_only(self):
+        self.service.changelog("bench", "repo", "v0.1", "v0.2")
+        self.service.changelog("bench", "repo", "v0.2")
+
+        self.assertEqual(self.service.invalidate("bench", "repo", unreleased_only=True), 1)
+        self.assertTrue(self.service.changelog("bench", "repo", "v0.1", "v0.2")[1])
+        self.assertFalse(self.service.changelog("bench", "repo", "v0.2")[1])
+
+    def test_changelog_generated_during_invalidation_is_not_kept(self):
+        generate = self.service._generate
+
+        def generate_then_push(*key):
+            changelog = generate(*key)
+            self.service.invalidate("bench", "repo", unreleased_only=True)
+            return changelog
+
+        self.service._generate = generate_then_push
+        self.service.changelog("bench", "repo", "v0.1", "v0.2")
+        self.service.changelog("bench", "repo", "v0.2")
+        self.service._generate = generate
+
+        # Only the changelog up to the branch head could have gone stale
+        self.assertTrue(self.service.changelog("bench", "repo", "v0.1", "v0.2")[1])
+        self.assertFalse(self.service.changelog("bench", "repo", "v0.2")[1])
+
+
+class CoalescingTestCase(unittest.TestCase):
+    """ Concurrent requests for a changelog share one generation """
+
+    workers = 8
+
+    def setUp(self):
+        self.fake = start_fake_github()
+        self.service = ChangelogService(github_api_url=self.fake.url)
+        self.generations = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        generate = self.service._generate
+
+        def blocking_generate(*key):
+            self.generations += 1
+            self.started.set()
+            self.release.wait(5)
+            return generate(*key)
+
+        self.service._generate = blocking_generate
+
+    def tearDown(self):
+        self.service.close()
+        self.fake.shutdown()
+        self.fake.server_close()
+
+    def run_concurrently(self, *key):
+        results = [None] * self.workers
+
+        def run(i):
+            try:
+                results[i] = self.service.changelog(*key)
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(self.workers)]
+        threads[0].start()
+        self.assertTrue(self.started.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+        # Give the others time to find the generation in flight
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_concurrent_requests_share_a_generation(self):
+        results = self.run_concurrently("bench", "repo", "v0.1", "v0.2")
+
+        self.assertEqual(self.generations, 1)
+        self.assertEqual(len({changelog for changelog, _ in results}), 1)
+        self.assertEqual([cached for _, cached in results].count(False), 1)
+
+    def test_concurrent_requests_share_a_failure(self):
+        results = self.run_concurrently("bench", "repo", "v0.1", "v9")
+
+        self.assertEqual(self.generations, 1)
+        for result in results:
+            self.assertIsInstance(result, GitHubError)
+
+        # Failures aren't kept
+        self.started.clear()
+        self.run_concurrently("bench", "repo", "v0.1", "v9")
+        self.assertEqual(self.generations, 2)
+
+
+class ChangelogServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fake = start_fake_github()
+        self.service = ChangelogService(github_api_url=self.fake.url)
+        self.server = ChangelogServer(("127.0.0.1", 0), self.service)
+        serve_in_background(self.server)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        quiet = mock.patch.object(ChangelogRequestHandler, "log_message")
+        quiet.start()
+        self.addCleanup(quiet.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.close()
+        self.fake.shutdown()
+        self.fake.server_close()
+
+    def request(self, path, method="GET"):
+        try:
+            with urlopen(Request(self.url + path, method=method)) as response:
+                return response.status, response.headers, response.read().decode()
+        except HTTPError as e:
+            return e.code, e.headers, e.read().decode()
+
+    def test_get_changelog(self):
+        status, headers, body = self.request("/bench/repo/v0.1...v0.2")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["X-Cache"], "MISS")
+        self.assertIn("Change 15", body)
+
+        _, headers, _ = self.request("/bench/repo/v0.1...v0.2")
+        self.assertEqual(headers["X-Cache"], "HIT")
+
+    def test_delete_forgets_repo(self):
+        self.request("/bench/repo/v0.1...v0.2")
+        status, _, body = self.request("/bench/repo", method="DELETE")
+        self.assertEqual(status, 200)
+        self.assertEqual(body, "Forgot 1 changelogs\n")
+
+        _, headers, _ = self.request("/bench/repo/v0.1...v0.2")
+        self.assertEqual(headers["X-Cache"], "MISS")
+
+    def test_unknown_tag_is_a_bad_gateway(self):
+        self.assertEqual(self.request("/bench/repo/v0.1...v9")[0], 502)
+
+    def test_bad_path(self):
+        self.assertEqual(self.request("/bench")[0], 404)
+
+    def test_metrics_only_served_when_kept(self):
+        self.assertEqual(self.request("/metrics")[0], 404)
+
+
+class ParsePathTestCase(unittest.TestCase):
+    def test_parse_path(self):
+        self.assertEqual(parse_path("/o/r"), ("o", "r", None, None))
+        self.assertEqual(parse_path("/o/r/v1"), ("o", "r", "v1", None))
+        self.assertEqual(parse_path("/o/r/v1...v2"), ("o", "r", "v1", "v2"))
+        self.assertEqual(parse_path("/o/r/v%2F1...v2?x=1"), ("o", "r", "v/1", "v2"))
+        self.assertIsNone(parse_path("/o"))
+        self.assertIsNone(parse_path("/o/r/...v2"))
@@ -0,0 +1,116 @@
+import gzip
+import json
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from changelog.tests.test_server import serve_in_background
+from changelog.transport import HTTPClientTransport, TransportError
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """ Answers with what it was sent and the client's port, which shows
+    whether the connection was reused """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(0.5)
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/redirect/"):
+            status = int(self.path.split("/")[2])
+            return self._send(status, {}, Location="/echo")
+        self._send(200, self._echo(body))
+
+    def _echo(self, body=b""):
+        return {
+            "method": self.command,
+            "path": self.path,
+            "body": body.decode(),
+            "port": self.client_address[1],
+            "accept_encoding": self.headers.get("Accept-Encoding"),
+        }
+
+    def _send(self, status, body, **headers):
+        data = json.dumps(body).encode("utf-8")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class HTTPClientTransportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+        self.server.daemon_threads = True
+        serve_in_background(self.server)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.transport = HTTPClientTransport()
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path, **kwargs):
+        return self.transport.request("GET", self.url + path, timeout=5, **kwargs)
+
+    def test_connection_is_reused(self):
+        first = self.get("/echo").json()
+        second = self.get("/echo").json()
+        self.assertEqual(first["port"], second["port"])
+
+        # Unless the caller asks for it to be closed
+        third = self.get("/echo", headers={"Connection": "close"}).json()
+        self.assertEqual(third["port"], first["port"])
+        self.assertNotEqual(self.get("/echo").json()["port"], first["port"])
+
+    def test_gzipped_response_is_decoded(self):
+        response = self.get("/echo", params={"page": "2"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.json()["accept_encoding"], "gzip")
+        self.assertEqual(response.json()["path"], "/echo?page=2")
+
+    def test_redirect_is_followed(self):
+        response = self.get("/redirect/301")
+        self.assertEqual(response.url, self.url + "/echo")
+        self.assertEqual(response.json()["method"], "GET")
+
+    def test_redirect_keeps_the_method_only_when_asked_to(self):
+        for status, method, body in ((302, "GET", ""), (307, "POST", '{"a": 1}')):
+            with self.subTest(status=status):
+                response = self.transport.request(
+                    "POST", f"{self.url}/redirect/{status}", json={"a": 1}, timeout=5
+                )
+                self.assertEqual(response.json()["method"], method)
+                self.assertEqual(response.json()["body"], body)
+
+    def test_timeout_is_a_transport_error(self):
+        with self.assertRaises(TransportError):
+            self.transport.request("GET", self.url + "/slow", timeout=(5, 0.05))
+        # The timed out connection isn't put back in the pool
+        self.assertEqual(self.get("/echo").status_code, 200)
+
+    def test_connection_refused_is_a_transport_error(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.transport.close()
+        with self.assertRaises(TransportError):
+            self.get("/echo")
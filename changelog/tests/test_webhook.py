@@ -0,0 +1,209 @@
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from changelog.server import ChangelogRequestHandler, ChangelogServer, ChangelogService
+from changelog.tests.test_server import serve_in_background, start_fake_github
+from changelog.webhook import WebhookReceiver, pull_request_from_webhook
+
+PAYLOADS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+SECRET = "It's a Secret to Everybody"
+
+
+def load_payload(name):
+    with open(os.path.join(PAYLOADS, f"{name}.json"), "rb") as f:
+        return f.read()
+
+
+def sign(body, secret=SECRET):
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+class VerifyTestCase(unittest.TestCase):
+    def test_signature_from_githubs_documentation(self):
+        webhook = WebhookReceiver(None, SECRET)
+        signature = "sha256=757107ea0eb2509fc211221cce984b8a37570b6d7586c22c46f4379c8b043e17"
+        self.assertTrue(webhook.verify(b"Hello, World!", signature))
+
+    def test_wrong_signature(self):
+        webhook = WebhookReceiver(None, SECRET)
+        body = load_payload("push_branch")
+        self.assertFalse(webhook.verify(body, sign(body, "another secret")))
+        self.assertFalse(webhook.verify(body + b" ", sign(body)))
+        self.assertFalse(webhook.verify(body, None))
+
+    def test_without_secret(self):
+        webhook = WebhookReceiver(None)
+        self.assertTrue(webhook.verify(load_payload("push_branch"), None))
+
+
+class HandleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fake = start_fake_github()
+        self.directory = tempfile.mkdtemp()
+        self.service = ChangelogService(
+            github_api_url=self.fake.url,
+            metadata_db=os.path.join(self.directory, "metadata.db"),
+        )
+        self.webhook = WebhookReceiver(self.service, SECRET)
+
+    def tearDown(self):
+        self.service.close()
+        self.fake.shutdown()
+        self.fake.server_close()
+        shutil.rmtree(self.directory)
+
+    def handle(self, event, name, **changes):
+        payload = json.loads(load_payload(name))
+        payload.update(changes)
+        return self.webhook.handle(event, payload)
+
+    def cached(self, *tags):
+        return self.service.changelog("bench", "repo", *tags)[1]
+
+    def wait_for_precompute(self):
+        self.service._background.shutdown(wait=True)
+
+    def test_branch_push_forgets_unreleased_changelogs(self):
+        self.service.changelog("bench", "repo", "v0.1", "v0.2")
+        self.service.changelog("bench", "repo", "v0.2")
+
+        message = self.handle("push", "push_branch")
+        self.assertEqual(message, "Forgot 1 changelogs for bench/repo")
+        self.assertTrue(self.cached("v0.1", "v0.2"))
+        self.assertFalse(self.cached("v0.2"))
+
+    def test_new_tag_is_precomputed(self):
+        self.service.changelog("bench", "repo", "v0.2")
+
+        message = self.handle("create", "create_tag")
+        self.assertEqual(
+            message,
+            "Forgot 1 changelogs for bench/repo, precomputing the changelog for v1",
+        )
+        self.wait_for_precompute()
+        self.assertTrue(self.cached("v0.2", "v1"))
+        self.assertFalse(self.cached("v0.2"))
+
+    def test_push_of_new_tag_keeps_precomputed_changelog(self):
+        # GitHub delivers both events for a new tag
+        self.handle("create", "create_tag")
+        self.wait_for_precompute()
+        self.handle("push", "push_tag")
+        self.assertTrue(self.cached("v0.2", "v1"))
+
+    def test_moved_tag_forgets_every_changelog(self):
+        self.service.changelog("bench", "repo", "v0.1", "v0.2")
+        self.service.changelog("bench", "repo", "v0.2")
+
+        message = self.handle("push", "push_tag", created=False, forced=True)
+        self.assertEqual(message, "Forgot 2 changelogs for bench/repo")
+        self.assertFalse(self.cached("v0.1", "v0.2"))
+
+    def test_moved_tag_is_forgotten_by_the_metadata_store(self):
+        changelog, _ = self.service.changelog("bench", "repo", "v0.1", "v0.2")
+        self.assertNotIn("#25", changelog)
+
+        self.fake.repo.tags["v0.2"] = 25
+        self.handle("push", "push_tag", ref="refs/tags/v0.2", created=False, forced=True)
+        self.assertIsNone(self.service.store.get_tag("bench", "repo", "v0.2"))
+        changelog, _ = self.service.changelog("bench", "repo", "v0.1", "v0.2")
+        self.assertIn("#25", changelog)
+
+    def test_deleted_tag_is_forgotten(self):
+        self.service.changelog("bench", "repo", "v0.1", "v0.2")
+        self.assertIsNotNone(self.service.store.get_tag("bench", "repo", "v0.2"))
+
+        message = self.handle("delete", "delete_tag")
+        self.assertEqual(message, "Forgot 1 changelogs for bench/repo")
+        self.assertIsNone(self.service.store.get_tag("bench", "repo", "v0.2"))
+        self.assertIsNotNone(self.service.store.get_tag("bench", "repo", "v0.1"))
+
+    def test_merged_pull_request_is_stored(self):
+        self.service.changelog("bench", "repo", "v0.2")
+
+        message = self.handle("pull_request", "pull_request_merged")
+        self.assertEqual(message, "Forgot 1 changelogs for bench/repo")
+        stored = self.service.store.get_pull_requests("bench", "repo", [31])
+        payload = json.loads(load_payload("pull_request_merged"))
+        self.assertEqual(stored, {31: pull_request_from_webhook(payload["pull_request"])})
+        self.assertEqual(stored[31].title, "Fix the flux capacitor")
+        self.assertEqual(stored[31].author, "dev3")
+        self.assertEqual(stored[31].labels, ("bug",))
+
+    def test_unmerged_pull_request_is_ignored(self):
+        payload = json.loads(load_payload("pull_request_merged"))
+        payload["pull_request"].update(merged=False, merged_at=None)
+        message = self.webhook.handle("pull_request", payload)
+        self.assertEqual(message, "Ignored unmerged PR #31")
+        self.assertEqual(self.service.store.get_pull_requests("bench", "repo", [31]), {})
+
+    def test_unsigned_pull_request_is_not_stored(self):
+        self.webhook = WebhookReceiver(self.service)
+        self.handle("pull_request", "pull_request_merged")
+        self.assertEqual(self.service.store.get_pull_requests("bench", "repo", [31]), {})
+
+    def test_other_events_are_ignored(self):
+        self.assertEqual(self.handle("ping", "push_branch"), "Ignored ping event")
+        self.assertEqual(
+            self.webhook.handle("push", {}), "Ignored push event without a repository"
+        )
+
+
+class DeliveryTestCase(unittest.TestCase):
+    """ Webhooks posted to the service """
+
+    def setUp(self):
+        self.fake = start_fake_github()
+        self.service = ChangelogService(github_api_url=self.fake.url)
+        self.server = ChangelogServer(("127.0.0.1", 0), self.service, SECRET)
+        serve_in_background(self.server)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/webhook"
+        quiet = mock.patch.object(ChangelogRequestHandler, "log_message")
+        quiet.start()
+        self.addCleanup(quiet.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.close()
+        self.fake.shutdown()
+        self.fake.server_close()
+
+    def deliver(self, event, body, signature):
+        request = Request(self.url, data=body, method="POST")
+        request.add_header("Content-Type", "application/json")
+        request.add_header("X-GitHub-Event", event)
+        if signature is not None:
+            request.add_header("X-Hub-Signature-256", signature)
+        try:
+            with urlopen(request) as response:
+                return response.status, response.read().decode()
+        except HTTPError as e:
+            return e.code, e.read().decode()
+
+    def test_signed_delivery(self):
+        self.service.changelog("bench", "repo", "v0.2")
+        body = load_payload("push_branch")
+        status, message = self.deliver("push", body, sign(body))
+        self.assertEqual(status, 200)
+        self.assertEqual(message, "Forgot 1 changelogs for bench/repo\n")
+
+    def test_unsigned_delivery_is_refused(self):
+        self.service.changelog("bench", "repo", "v0.2")
+        body = load_payload("push_branch")
+        self.assertEqual(self.deliver("push", body, None)[0], 401)
+        self.assertEqual(self.deliver("push", body, sign(body, "wrong"))[0], 401)
+        self.assertTrue(self.service.changelog("bench", "repo", "v0.2")[1])
+
+    def test_body_that_is_not_json(self):
+        body = b"payload=%7B%7D"
+        self.assertEqual(self.deliver("push", body, sign(body))[0], 400)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Per-request instrumentation of the GitHub API client: every request made, or
+answered from the response cache, is reported to hooks as a span.
+"""
+import json
+import re
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+# Response headers that describe the rate limit budget
+RATE_LIMIT_HEADERS = (
+    "X-RateLimit-Limit",
+    "X-RateLimit-Remaining",
+    "X-RateLimit-Reset",
+    "X-RateLimit-Used",
+    "X-RateLimit-Resource",
+    "Retry-After",
+)
+
+# Path segments that identify an object rather than an endpoint. They are
+# compiled on first use rather than when the package is imported.
+REST_ENDPOINT_PATTERNS = [
+    (r"git/refs/tags/.+", "git/refs/tags/{tag}"),
+    (r"git/tags/\w+", "git/tags/{sha}"),
+    (r"commits/\w+", "commits/{sha}"),
+    (r"compare/.+", "compare/{range}"),
+]
+
+# How wide the bars of the waterfall are
+WATERFALL_WIDTH = 30
+
+
+@dataclass(frozen=True)
+class RequestSpan:
+    method: str
+    url: str
+    # The URL with the repo and anything naming an object left out, or the
+    # kind of GraphQL query
+    endpoint: str
+    # Epoch seconds the request was sent at
+    started: float
+    duration: float
+    # None if the request failed without a response or never left the cache
+    status: Optional[int] = None
+    size: int = 0
+    # "hit" or "miss" for requests that went through the response cache
+    cache: Optional[str] = None
+    # 0 for the first try, counting up for each retry
+    attempt: int = 0
+    rate_limit: Dict[str, str] = field(default_factory=dict)
+    error: Optional[str] = None
+    # Rate limit points a GraphQL query cost
+    graphql_cost: Optional[int] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.method} {self.endpoint}"
+
+    def to_json(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+RequestHook = Callable[[RequestSpan], None]
+
+
+def rest_endpoint(path: str) -> str:
+    """ Name the endpoint a path relative to a repo's URL belongs to """
+    for pattern, endpoint in REST_ENDPOINT_PATTERNS:
+        if re.match(pattern, path):
+            return endpoint
+    return path
+
+
+def rate_limit_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    return {name: headers[name] for name in RATE_LIMIT_HEADERS if name in headers}
+
+
+class TraceRecorder:
+    """ A hook that keeps every span, to be written to a JSON trace file or
+    summarized as a waterfall once the run is over """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans: List[RequestSpan] = []
+
+    def __call__(self, span: RequestSpan) -> None:
+        with self._lock:
+            self._spans.append(span)
+
+    @property
+    def spans(self) -> List[RequestSpan]:
+        """ The spans so far, in the order the requests were sent """
+        with self._lock:
+            return sorted(self._spans, key=lambda span: span.started)
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({"spans": [span.to_json() for span in self.spans]}, f, indent=2)
+
+    def waterfall(self, width: int = WATERFALL_WIDTH) -> List[str]:
+        """ A line per request showing when it started and how long it took
+        relative to the whole run """
+        spans = self.spans
+        if not spans:
+            return ["No requests were made"]
+        start = spans[0].started
+        total = max(span.started + span.duration for span in spans) - start
+        lines = [
+            f"{len(spans)} requests in {total:.3f}s",
+            f"{'start':>8} {'time':>8} {'status':>6} {'cache':>5} {'bytes':>8}  "
+            f"{'timeline':<{width}}  endpoint",
+        ]
+        for span in spans:
+            offset = span.started - start
+            column = int(offset / total * width) if total else 0
+            length = max(1, round(span.duration / total * width)) if total else 1
+            bar = (" " * column + "#" * length)[:width]
+            status = span.status if span.status is not None else "-"
+            if span.error is not None:
+                status = "error"
+            lines.append(
+                f"{offset:>7.3f}s {span.duration:>7.3f}s {status:>6} "
+                f"{span.cache or '-':>5} {span.size:>8}  {bar:<{width}}  {span.name}"
+            )
+        return lines
+
+
+class OpenTelemetryExporter:
+    """ A hook that turns spans into OpenTelemetry spans, to be exported by
+    whichever span processors the ``tracer`` was set up with. Needs the
+    ``opentelemetry-api`` package. """
+
+    def __init__(self, tracer=None):
+        if tracer is None:
+            from opentelemetry import trace
+
+            tracer = trace.get_tracer("changelog")
+        self.tracer = tracer
+
+    def __call__(self, span: RequestSpan) -> None:
+        from opentelemetry.trace import SpanKind, Status, StatusCode
+
+        attributes = {
+            "http.request.method": span.method,
+            "url.full": span.url,
+            "http.response.body.size": span.size,
+            "github.endpoint": span.endpoint,
+            "github.attempt": span.attempt,
+        }
+        if span.status is not None:
+            attributes["http.response.status_code"] = span.status
+        if span.cache is not None:
+            attributes["github.cache"] = span.cache
+        if span.graphql_cost is not None:
+            attributes["github.graphql_cost"] = span.graphql_cost
+        for name, value in span.rate_limit.items():
+            attributes[f"github.{name.lower().replace('-', '_')}"] = value
+
+        started = int(span.started * 1e9)
+        otel_span = self.tracer.start_span(
+            span.name, kind=SpanKind.CLIENT, start_time=started, attributes=attributes
+        )
+        failed = span.error is not None or (span.status or 0) >= 400
+        if failed:
+            otel_span.set_status(Status(StatusCode.ERROR, span.error))
+        otel_span.end(end_time=started + int(span.duration * 1e9))
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+A dependency free alternative to ``requests`` for talking to the GitHub API,
+built on ``http.client`` with pooled keep-alive connections and gzip.
+
+A transport is anything with the ``request`` and ``close`` methods of a
+``requests.Session`` that :class:`~changelog.GithubAPI` uses, returning
+responses with ``status_code``, ``headers``, ``content``, ``url`` and
+``json()``. A ``requests.Session`` is one, :class:`HTTPClientTransport`
+another.
+"""
+import gzip
+import http.client
+import json
+import ssl
+import threading
+import zlib
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple, Union
+from urllib.parse import urlencode, urljoin, urlsplit
+
+# How many redirects are followed before giving up
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Connections a server may have closed while they sat in the pool
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+# (scheme, host, port)
+ConnectionKey = Tuple[str, str, int]
+
+
+class TransportError(Exception):
+    """ A request failed to connect, timed out or was cut short """
+
+
+class Headers(Mapping[str, str]):
+    """ Response headers, looked up regardless of case """
+
+    def __init__(self, items: List[Tuple[str, str]]):
+        self._headers: Dict[str, Tuple[str, str]] = {}
+        for name, value in items:
+            key = name.lower()
+            if key in self._headers:
+                value = f"{self._headers[key][1]}, {value}"
+            self._headers[key] = (name, value)
+
+    def __getitem__(self, name: str) -> str:
+        return self._headers[name.lower()][1]
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name, _ in self._headers.values())
+
+    def __len__(self) -> int:
+        return len(self._headers)
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and name.lower() in self._headers
+
+
+class TransportResponse:
+    def __init__(self, status_code: int, headers: Headers, content: bytes, url: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+class HTTPClientTransport:
+    """ Makes requests with ``http.client``, keeping up to ``pool_maxsize``
+    idle connections per host open to be reused. Responses are asked for
+    gzipped. ``headers`` are sent with every request.
+
+    Unlike ``requests`` no proxy is used and certificates are checked
+    against the system's trusted certificates. """
+
+    # What GithubAPI retries requests after
+    retryable_exceptions = (TransportError,)
+
+    def __init__(self, pool_maxsize: int = 10):
+        self.pool_maxsize = pool_maxsize
+        self.headers: Dict[str, str] = {"Accept-Encoding": "gzip"}
+        self._lock = threading.Lock()
+        self._idle: Dict[ConnectionKey, List[http.client.HTTPConnection]] = {}
+        self._ssl_context: Optional[ssl.SSLContext] = None
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Mapping[str, str]] = None,
+        json: Any = None,
+        headers: Optional[Mapping[str, str]] = None,
+        timeout: Union[None, float, Tuple[float, float]] = None,
+    ) -> TransportResponse:
+        request_headers = dict(self.headers)
+        request_headers.update(headers or {})
+        body = None
+        if json is not None:
+            body = _dumps(json)
+            request_headers["Content-Type"] = "application/json"
+        if params:
+            url += ("&" if urlsplit(url).query else "?") + urlencode(params)
+
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._send(method, url, body, request_headers, timeout)
+            location = response.headers.get("Location")
+            if response.status_code not in REDIRECT_STATUSES or location is None:
+                return response
+
+            # Only these keep the method and body, as requests does
+            if response.status_code not in (307, 308) and method != "HEAD":
+                method, body = "GET", None
+                request_headers.pop("Content-Type", None)
+            next_url = urljoin(url, location)
+            if urlsplit(next_url).netloc != urlsplit(url).netloc:
+                request_headers.pop("Authorization", None)
+            url = next_url
+        raise TransportError(f"Exceeded {MAX_REDIRECTS} redirects")
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        body: Optional[bytes],
+        headers: Dict[str, str],
+        timeout: Union[None, float, Tuple[float, float]],
+    ) -> TransportResponse:
+        connect_timeout, read_timeout = (
+            timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        )
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        key = (parts.scheme, parts.hostname, parts.port or _default_port(parts.scheme))
+        keep_alive = headers.get("Connection", "").lower() != "close"
+
+        connection, reused = self._checkout(key, connect_timeout)
+        try:
+            try:
+                response = self._exchange(
+                    connection, method, path, body, headers, read_timeout
+                )
+            except STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                # The server closed it while it was idle, try a new one once
+                connection.close()
+                connection, _ = self._checkout(key, connect_timeout, fresh=True)
+                response = self._exchange(
+                    connection, method, path, body, headers, read_timeout
+                )
+            content = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise TransportError(f"{method} {url} failed: {e!r}") from e
+
+        if response.will_close or not keep_alive:
+            connection.close()
+        else:
+            self._checkin(key, connection)
+
+        if response.getheader("Content-Encoding", "").lower() == "gzip":
+            try:
+                content = gzip.decompress(content)
+            except (OSError, EOFError, zlib.error) as e:
+                raise TransportError(f"{method} {url} sent a bad gzip body: {e}") from e
+        return TransportResponse(
+            response.status, Headers(response.getheaders()), content, url
+        )
+
+    @staticmethod
+    def _exchange(
+        connection: http.client.HTTPConnection,
+        method: str,
+        path: str,
+        body: Optional[bytes],
+        headers: Dict[str, str],
+        read_timeout: Optional[float],
+    ) -> http.client.HTTPResponse:
+        if connection.sock is None:
+            connection.connect()
+        connection.sock.settimeout(read_timeout)
+        connection.request(method, path, body=body, headers=headers)
+        return connection.getresponse()
+
+    def _checkout(
+        self, key: ConnectionKey, connect_timeout: Optional[float], fresh: bool = False
+    ) -> Tuple[http.client.HTTPConnection, bool]:
+        """ An idle connection to the host if there is one, otherwise a new
+        one, and whether it was reused """
+        if not fresh:
+            with self._lock:
+                idle = self._idle.get(key)
+                if idle:
+                    return idle.pop(), True
+
+        scheme, host, port = key
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(
+                host, port, timeout=connect_timeout, context=self._context()
+            )
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=connect_timeout)
+        return connection, False
+
+    def _checkin(self, key: ConnectionKey, connection: http.client.HTTPConnection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.pool_maxsize:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _context(self) -> ssl.SSLContext:
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+
+def _default_port(scheme: str) -> int:
+    return 443 if scheme == "https" else 80
+
+
+def _dumps(value: Any) -> bytes:
+    # request() takes the body as a json argument, as requests does
+    return json.dumps(value).encode("utf-8")
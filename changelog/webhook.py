@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Keep a :class:`~changelog.server.ChangelogService` fresh from GitHub webhook
+events rather than by polling GitHub.
+"""
+import hashlib
+import hmac
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from changelog import PullRequest, parse_datetime_string
+
+if TYPE_CHECKING:
+    from changelog.server import ChangelogService
+
+TAG_REF_PREFIX = "refs/tags/"
+
+
+class WebhookReceiver:
+    """ Handles ``push``, ``create``, ``delete`` and ``pull_request`` events.
+
+    Pushes and merged PRs make the unreleased changelogs of their repo stale,
+    merged PRs are also added to the metadata store. Moving or deleting a tag
+    makes every changelog of the repo stale and removes the tag from the
+    metadata store. A new tag makes every
+    changelog ending at a branch head stale, and the changelog from the
+    previous tag to it is precomputed in the background. When a ``secret``
+    is given, events must be signed with it. Without one anybody could send
+    events, so merged PRs aren't written to the metadata store, where they
+    would be kept for good. """
+
+    def __init__(self, service: "ChangelogService", secret: Optional[str] = None):
+        self.service = service
+        self.secret = secret
+
+    def verify(self, body: bytes, signature: Optional[str]) -> bool:
+        """ Check the ``X-Hub-Signature-256`` header of a delivery """
+        if self.secret is None:
+            return True
+        if signature is None:
+            return False
+        digest = hmac.new(self.secret.encode("utf-8"), body, hashlib.sha256)
+        return hmac.compare_digest(f"sha256={digest.hexdigest()}", signature)
+
+    def handle(self, event: str, payload: Dict[str, Any]) -> str:
+        """ Act on an event, returning a description of what was done """
+        repository = payload.get("repository")
+        if not repository:
+            return f"Ignored {event} event without a repository"
+        owner = repository["owner"]["login"]
+        repo = repository["name"]
+
+        if event == "push":
+            is_tag = payload["ref"].startswith(TAG_REF_PREFIX)
+            if is_tag and not payload.get("created"):
+                # A tag was moved or deleted
+                self.forget_tag(owner, repo, payload["ref"][len(TAG_REF_PREFIX):])
+                count = self.service.invalidate(owner, repo)
+            else:
+                # New tags come with a create event as well, which handles them
+                count = self.service.invalidate(owner, repo, unreleased_only=True)
+            return f"Forgot {count} changelogs for {owner}/{repo}"
+
+        if event == "create" and payload.get("ref_type") == "tag":
+            count = self.service.invalidate(owner, repo, unreleased_only=True)
+            self.service.precompute_release(owner, repo, payload["ref"])
+            return (
+                f"Forgot {count} changelogs for {owner}/{repo}, "
+                f"precomputing the changelog for {payload['ref']}"
+            )
+
+        if event == "delete" and payload.get("ref_type") == "tag":
+            self.forget_tag(owner, repo, payload["ref"])
+            count = self.service.invalidate(owner, repo)
+            return f"Forgot {count} changelogs for {owner}/{repo}"
+
+        if event == "pull_request" and payload.get("action") == "closed":
+            pr_json = payload["pull_request"]
+            if not pr_json.get("merged"):
+                return f"Ignored unmerged PR #{pr_json['number']}"
+            if self.service.store is not None and self.secret is not None:
+                pr = pull_request_from_webhook(pr_json)
+                self.service.store.put_pull_requests(owner, repo, [pr])
+            count = self.service.invalidate(owner, repo, unreleased_only=True)
+            return f"Forgot {count} changelogs for {owner}/{repo}"
+
+        return f"Ignored {event} event"
+
+    def forget_tag(self, owner: str, repo: str, name: str) -> None:
+        """ Stop the metadata store answering for a moved or deleted tag """
+        if self.service.store is not None:
+            self.service.store.delete_tag(owner, repo, name)
+
+
+def pull_request_from_webhook(pr_json: Dict[str, Any]) -> PullRequest:
+    """ Read a PR from the REST representation webhooks deliver """
+    # Deleted accounts come back as a null user
+    user = pr_json.get("user") or {"login": "ghost"}
+    merged_at = pr_json.get("merged_at")
+    return PullRequest(
+        number=pr_json["number"],
+        title=pr_json["title"],
+        author=user["login"],
+        merged_at=parse_datetime_string(merged_at) if merged_at else None,
+        merge_commit_sha=pr_json.get("merge_commit_sha"),
+        base_ref_name=(pr_json.get("base") or {}).get("ref"),
+        labels=tuple(label["name"] for label in pr_json.get("labels", ())),
+    )
@@ -25,9 +25,19 @@ setup(
             'coverage>=3.7.0',
             'flake8>=2.2.0',
         ],
+        'opentelemetry': [
+            'opentelemetry-api>=1.0',
+        ],
+        'prometheus': [
+            'prometheus_client>=0.4',
+        ],
     },
     test_suite="changelog.tests",
     entry_points={
-        'console_scripts': ['changelog = changelog:main', ]
+        'console_scripts': [
+            'changelog = changelog:main',
+            'changelog-batch = changelog.batch:main',
+            'changelog-serve = changelog.server:main',
+        ]
     }
 )